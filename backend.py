@@ -0,0 +1,33 @@
+"""The data-layer functions the UI calls: db.py itself, or a remote server.py.
+
+Set BOOKMANAGER_SERVER=host:port to run the app against a server instead
+of opening library.db locally. The server owns the schema, so migrations
+and index builds are no-ops here in that case. Locally, writes go through
+the write queue so concurrent saves are group-committed.
+"""
+import os
+
+from db import EXPORT_COLUMNS, FACETS, INVENTORY_FIELDS
+from rpc import METHODS, WRITE_METHODS, RemoteBackend
+
+__all__ = ["EXPORT_COLUMNS", "FACETS", "INVENTORY_FIELDS", "migrate", "build_pending_indexes", *METHODS]
+
+SERVER = os.environ.get("BOOKMANAGER_SERVER")
+
+if SERVER:
+    remote = RemoteBackend(SERVER)
+    globals().update({name: getattr(remote, name) for name in METHODS})
+
+    def migrate():
+        return []
+
+    def build_pending_indexes(progress=None):
+        pass
+else:
+    import db
+    from write_queue import write_queue
+
+    globals().update({name: write_queue.wrap(getattr(db, name)) if name in WRITE_METHODS else getattr(db, name)
+                      for name in METHODS})
+    migrate = db.migrate
+    build_pending_indexes = db.build_pending_indexes
@@ -0,0 +1,394 @@
+"""Benchmark the db.py data layer against isolated, generated catalogs.
+
+    python benchmark.py --sizes 50k 500k --output bench.json
+    python benchmark.py --sizes 50k --compare bench.json
+
+Each size gets its own database under bench_data/ (reused between runs
+unless --rebuild is given), filled with deterministic synthetic data.
+Every public db.py function is timed and reported as p50/p95/p99 latency
+and throughput in JSON. With --compare, cases whose p95 got slower than
+--threshold times the baseline are listed and the exit code is 1.
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import connection
+import db
+
+# name -> (books, users); each catalog also gets one loan per book
+SIZES = {
+    "50k": (50_000, 5_000),
+    "500k": (500_000, 500_000),
+    "5m": (5_000_000, 500_000),
+}
+
+# Admin/maintenance functions that aren't on any request path
+NOT_TIMED = {"create_tables", "migrate", "build_pending_indexes", "has_pending_indexes", "get_schema_version",
+             "rebuild_search_index", "clear_caches", "cache_stats"}
+
+LANGUAGES = ['English', 'Spanish', 'French', 'German', 'Arabic']
+GENRES = ['Fiction', 'Non-fiction', 'Sci-Fi', 'Fantasy', 'Biography']
+STATUSES = ['Available', 'Not Available', 'Missing']
+SYLLABLES = ["an", "ber", "cal", "dor", "el", "fin", "gar", "hol", "is", "jor", "kel", "lan", "mor", "nel", "or",
+             "par", "quin", "ros", "sel", "tor", "ul", "ven", "wil", "xan", "yor", "zel"]
+
+
+def _word(rng, parts):
+    return "".join(rng.choice(SYLLABLES) for _ in range(parts))
+
+
+def _isbn13(i):
+    """A valid ISBN-13 unique to book `i` (104729 is prime, so i -> digits doesn't repeat)."""
+    digits = [9, 7, 8] + [int(d) for d in f"{i * 104729 % 10 ** 9:09d}"]
+    check = (10 - sum(d * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10
+    return "".join(map(str, digits + [check]))
+
+
+def generate_books(n, seed=42):
+    rng = random.Random(seed)
+    vocabulary = [_word(rng, 3) for _ in range(5000)]
+    first_names = [_word(rng, 2).title() for _ in range(500)]
+    last_names = [_word(rng, 3).title() for _ in range(2000)]
+    for i in range(n):
+        book = {
+            "book_number": 100000 + i,
+            "title": f"{' '.join(rng.choice(vocabulary) for _ in range(4)).capitalize()} vol {i}",
+            "author": f"{rng.choice(first_names)} {rng.choice(last_names)}",
+            "translator": f"{rng.choice(first_names)} {rng.choice(last_names)}" if rng.random() > 0.7 else "",
+            "pub_date": f"{rng.randint(1900, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "isbn": _isbn13(i),
+            "language": rng.choice(LANGUAGES),
+            "genre": rng.choice(GENRES),
+            "edition": f"{rng.randint(1, 10)}th",
+            "status": rng.choice(STATUSES),
+        }
+        yield book, {"available": rng.randint(0, 3), "lent": rng.randint(0, 3)}
+
+
+def generate_users(n, seed=42):
+    rng = random.Random(seed + 1)
+    for i in range(n):
+        first, last = _word(rng, 2).title(), _word(rng, 3).title()
+        yield (f"{first} {last}", f"{first.lower()}.{last.lower()}{i}@example.org",
+               f"+1-555-{rng.randint(0, 9999999):07d}", rng.choice(["Regular", "Premium", "Student", "Staff"]),
+               rng.choice(["Active", "Inactive", "Suspended"]))
+
+
+def generate_loans(n, books, users, seed=42):
+    """Loan history: mostly returned, ~3% still out (some of them overdue)."""
+    rng = random.Random(seed + 2)
+    today = date.today()
+    for _ in range(n):
+        loan_date = today - timedelta(days=rng.randint(0, 730))
+        due_date = loan_date + timedelta(days=db.LOAN_DAYS)
+        returned = loan_date + timedelta(days=rng.randint(1, 30)) if rng.random() > 0.03 else None
+        yield (rng.randint(1, books), rng.randint(1, users), loan_date.isoformat(), due_date.isoformat(),
+               returned.isoformat() if returned else None)
+
+
+def build_database(path, books, users, rebuild=False, batch_size=50_000):
+    """Create (or reuse) a benchmark database; returns seconds spent building."""
+    if rebuild:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    fresh = not os.path.exists(path)
+    connection.configure(path)
+    db.create_tables()
+    if not fresh:
+        return 0.0
+
+    start = time.perf_counter()
+    batch = []
+    for item in generate_books(books):
+        batch.append(item)
+        if len(batch) >= batch_size:
+            db.insert_books_batch(batch)
+            batch.clear()
+    if batch:
+        db.insert_books_batch(batch)
+
+    conn = connection.get_connection()
+    with conn:
+        conn.executemany("INSERT INTO users (name, email, phone, membership_type, status) VALUES (?, ?, ?, ?, ?)",
+                         generate_users(users))
+        conn.executemany("INSERT INTO loans (book_id, user_id, loan_date, due_date, return_date) "
+                         "VALUES (?, ?, ?, ?, ?)", generate_loans(books, books, users))
+        conn.execute("ANALYZE")
+    return time.perf_counter() - start
+
+
+def _context(books, users):
+    """Pick the ids, cursors and search terms the cases run against."""
+    rng = random.Random(7)
+    deep_page = max(1, books // 100 - 1)
+    sample = db.get_books_after(db.get_books_page_cursor(books // 200 or 1, 100), 1)[0]
+    title_words = sample.title.split()
+    conn = connection.get_connection()
+    return {
+        "book_ids": [rng.randint(1, books) for _ in range(1000)],
+        "user_ids": [rng.randint(1, users) for _ in range(1000)],
+        "lendable_book": conn.execute("SELECT book_id FROM inventory WHERE available > 0 LIMIT 1").fetchone()[0],
+        "active_user": conn.execute("SELECT id FROM users WHERE status = 'Active' LIMIT 1").fetchone()[0],
+        "deep_page": deep_page,
+        "deep_book_cursor": db.get_books_page_cursor(deep_page, 100),
+        "deep_sorted_cursor": db.get_books_page_cursor(deep_page, 100, sort="author"),
+        "deep_user_cursor": db.get_users_page_cursor(max(1, users // 100 - 1), 100),
+        "sample": sample,
+        "common_term": "vol",
+        "rare_term": title_words[0],
+        # The sample's author with two letters swapped in each name
+        "typo_term": " ".join(w[0] + w[2] + w[1] + w[3:] if len(w) > 3 else w for w in sample.author.split()),
+        "user_term": "example.org" if users < 100_000 else "ander",
+        "filters": {"language": sample.language, "genre": sample.genre, "status": sample.status,
+                    "pub_from": "1990", "pub_to": "2000"},
+    }
+
+
+def _cases(ctx):
+    pick = iter(ctx["book_ids"] * 1000).__next__
+    pick_user = iter(ctx["user_ids"] * 1000).__next__
+    sample = ctx["sample"]
+    sample_data = sample.to_data()
+    scratch = {"book_number": 10 ** 12, "title": "Benchmark scratch book", "author": "Bench", "translator": "",
+               "pub_date": "", "isbn": "", "language": "", "genre": "", "edition": "", "status": "Available"}
+    scratch_user = {"name": "Bench User", "email": "bench@example.invalid", "phone": "", "membership_type": "Regular",
+                    "status": "Active"}
+
+    def insert_delete_book():
+        db.insert_book(scratch)
+        db.delete_book(db.find_book_by_title(scratch["title"]).id)
+
+    def insert_delete_user():
+        db.insert_user(scratch_user)
+        user_id = db.search_users(scratch_user["email"], exact=True)[0].id
+        db.update_user(user_id, {**scratch_user, "status": "Inactive"})
+        db.delete_user(user_id)
+
+    def batch_insert_delete():
+        rows = [({**scratch, "book_number": 10 ** 12 + i, "title": f"Benchmark batch {i}"}, {}) for i in range(1000)]
+        db.insert_books_batch(rows)
+        for book in db.search_books_page("Benchmark batch", page_size=1000)[0]:
+            db.delete_book(book.id)
+
+    # (name, callable, repeat override); reads first, writes last so writes
+    # don't invalidate caches between read samples
+    return [
+        ("get_books_after[first]", lambda: db.get_books_after(None, 100), None),
+        ("get_books_after[deep]", lambda: db.get_books_after(ctx["deep_book_cursor"], 100), None),
+        ("get_books_before[deep]", lambda: db.get_books_before(ctx["deep_book_cursor"], 100), None),
+        ("get_books_page_cursor[deep]", lambda: db.get_books_page_cursor(ctx["deep_page"], 100), None),
+        ("get_books_paginated[shallow]", lambda: db.get_books_paginated(2, 100), None),
+        ("get_books_paginated[deep]", lambda: db.get_books_paginated(ctx["deep_page"], 100), 20),
+        ("get_total_books_count", db.get_total_books_count, None),
+        ("find_book_by_title", lambda: db.find_book_by_title(sample.title), None),
+        ("find_books_by_isbn", lambda: db.find_books_by_isbn(sample.isbn), None),
+        ("get_copy_summary", lambda: db.get_copy_summary(pick()), None),
+        ("get_inventory", lambda: db.get_inventory(pick()), None),
+        ("get_copy_summary[uncached]", lambda: (db.clear_caches(), db.get_copy_summary(pick())), None),
+        ("get_book", lambda: db.get_book(pick()), None),
+        # Searches rank once and page from _search_cache, so the plain cases
+        # time a cached page and the [... uncached] ones a first page
+        ("search_books_page[common]", lambda: db.search_books_page(ctx["common_term"], page_size=100), 20),
+        ("search_books_page[common uncached]",
+         lambda: (db.clear_caches(), db.search_books_page(ctx["common_term"], page_size=100)), 5),
+        ("search_books_page[rare]", lambda: db.search_books_page(ctx["rare_term"], page_size=100), None),
+        ("search_books_page[rare uncached]",
+         lambda: (db.clear_caches(), db.search_books_page(ctx["rare_term"], page_size=100)), None),
+        ("search_books_page[exact]", lambda: db.search_books_page(sample.title, exact=True), 20),
+        ("search_books_page[isbn]", lambda: db.search_books_page(sample.isbn), None),
+        ("search_books_page_cursor[common]",
+         lambda: db.search_books_page_cursor(ctx["common_term"], page=5, page_size=100), 20),
+        ("search_books_page_cursor[common uncached]",
+         lambda: (db.clear_caches(), db.search_books_page_cursor(ctx["common_term"], page=5, page_size=100)), 5),
+        ("search_books[rare]", lambda: db.search_books(ctx["rare_term"]), None),
+        ("search_books_page[fuzzy]", lambda: db.search_books_page(ctx["typo_term"], page_size=10, fuzzy=True), 20),
+        ("search_books_page[fuzzy uncached]",
+         lambda: (db.clear_caches(), db.search_books_page(ctx["typo_term"], page_size=10, fuzzy=True)), 5),
+        ("search_books[exact]", lambda: db.search_books(sample.author, exact=True), 20),
+        ("count_search_results[common]", lambda: db.count_search_results(ctx["common_term"]), 20),
+        ("count_search_results[common uncached]",
+         lambda: (db.clear_caches(), db.count_search_results(ctx["common_term"])), 5),
+        ("count_search_results[rare]", lambda: db.count_search_results(ctx["rare_term"]), None),
+        ("get_facet_counts", db.get_facet_counts, None),
+        ("get_facet_counts[rare]", lambda: db.get_facet_counts(ctx["rare_term"]), None),
+        ("get_facet_counts[common]", lambda: db.get_facet_counts(ctx["common_term"]), 20),
+        ("get_facet_counts[common uncached]",
+         lambda: (db.clear_caches(), db.get_facet_counts(ctx["common_term"])), 5),
+        ("get_books_after[filtered]", lambda: db.get_books_after(None, 100, filters=ctx["filters"]), None),
+        ("get_books_page_cursor[filtered]",
+         lambda: db.get_books_page_cursor(2, 100, filters={"status": sample.status}), 20),
+        ("get_books_after[sorted deep]",
+         lambda: db.get_books_after(ctx["deep_sorted_cursor"], 100, sort="author"), None),
+        ("get_books_before[sorted deep]",
+         lambda: db.get_books_before(ctx["deep_sorted_cursor"], 100, sort="author"), None),
+        ("get_books_page_cursor[sorted]",
+         lambda: (db.clear_caches(), db.get_books_page_cursor(ctx["deep_page"], 100, sort="-title")), 5),
+        ("get_total_books_count[filtered]", lambda: db.get_total_books_count(ctx["filters"]), None),
+        ("find_duplicate_isbns", db.find_duplicate_isbns, 5),
+        ("get_facet_counts[filtered]", lambda: db.get_facet_counts(filters=ctx["filters"]), 20),
+        ("search_books_page[filtered]",
+         lambda: db.search_books_page(ctx["common_term"], page_size=100, filters=ctx["filters"]), 20),
+        ("search_books_page[filtered uncached]",
+         lambda: (db.clear_caches(), db.search_books_page(ctx["common_term"], page_size=100, filters=ctx["filters"])),
+         5),
+        ("get_users_after[deep]", lambda: db.get_users_after(ctx["deep_user_cursor"], 100), None),
+        ("get_users_before[deep]", lambda: db.get_users_before(ctx["deep_user_cursor"], 100), None),
+        ("get_users_page_cursor[deep]", lambda: db.get_users_page_cursor(2, 100), None),
+        ("get_users_paginated[deep]", lambda: db.get_users_paginated(max(1, ctx["deep_page"] // 10), 100), 20),
+        ("get_total_users_count", db.get_total_users_count, None),
+        ("search_users", lambda: db.search_users(ctx["user_term"]), 5),
+        ("search_users_page", lambda: db.search_users_page(ctx["user_term"], page_size=100), 20),
+        ("search_users_page_cursor", lambda: db.search_users_page_cursor(ctx["user_term"], page=3), 20),
+        ("count_search_users", lambda: db.count_search_users(ctx["user_term"]), 5),
+        ("get_overdue_loans", db.get_overdue_loans, None),
+        ("get_user_loans", lambda: db.get_user_loans(pick_user()), None),
+        ("get_book_loans", lambda: db.get_book_loans(pick(), open_only=True), None),
+        ("iter_books_for_export", lambda: sum(len(chunk) for chunk in db.iter_books_for_export()), 3),
+        ("get_export_rows_after[deep]", lambda: db.get_export_rows_after(ctx["deep_book_cursor"]), None),
+        ("update_inventory", lambda: db.update_inventory(pick(), available=2), None),
+        ("adjust_inventory", lambda: db.adjust_inventory(pick(), damaged=1), None),
+        ("adjust_inventory_batch[1000]",
+         lambda: db.adjust_inventory_batch([(book_id, {"missing": 1}) for book_id in ctx["book_ids"]]), 20),
+        ("update_book", lambda: db.update_book(sample.id, sample_data), None),
+        ("insert_book+delete_book", insert_delete_book, None),
+        ("insert_user+update_user+delete_user", insert_delete_user, None),
+        ("insert_books_batch[1000]", batch_insert_delete, 3),
+        ("checkout+checkin", lambda: db.checkin(db.checkout(ctx["lendable_book"], ctx["active_user"])), None),
+    ]
+
+
+def _percentile(sorted_samples, pct):
+    index = min(len(sorted_samples) - 1, max(0, round(pct / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def time_case(fn, repeat, warmup=3):
+    for _ in range(min(warmup, repeat)):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    total = sum(samples)
+    return {
+        "n": repeat,
+        "p50_ms": _percentile(samples, 50) * 1000,
+        "p95_ms": _percentile(samples, 95) * 1000,
+        "p99_ms": _percentile(samples, 99) * 1000,
+        "mean_ms": total / repeat * 1000,
+        "ops_per_sec": repeat / total if total else None,
+    }
+
+
+def untimed_functions(cases):
+    timed = {part.split("[")[0] for name, _, _ in cases for part in name.split("+")}
+    public = {name for name, obj in inspect.getmembers(db, inspect.isfunction)
+              if not name.startswith("_") and obj.__module__ == db.__name__}
+    return sorted(public - timed - NOT_TIMED)
+
+
+def run(sizes, repeat, workdir, rebuild=False, only=None):
+    os.makedirs(workdir, exist_ok=True)
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": repeat,
+        },
+        "datasets": [],
+    }
+    for size in sizes:
+        books, users = SIZES[size]
+        path = os.path.join(workdir, f"library_{size}.db")
+        print(f"[{size}] preparing {path} ({books} books, {users} users)...", file=sys.stderr)
+        build_seconds = build_database(path, books, users, rebuild=rebuild)
+        cases = _cases(_context(books, users))
+        missing = untimed_functions(cases)
+        if missing:
+            print(f"[{size}] not benchmarked: {', '.join(missing)}", file=sys.stderr)
+
+        results = {}
+        for name, fn, case_repeat in cases:
+            if only and not any(o in name for o in only):
+                continue
+            results[name] = time_case(fn, min(repeat, case_repeat or repeat))
+            print(f"[{size}] {name:40s} p50 {results[name]['p50_ms']:9.3f} ms  "
+                  f"p95 {results[name]['p95_ms']:9.3f} ms", file=sys.stderr)
+        report["datasets"].append({"size": size, "books": books, "users": users,
+                                   "build_seconds": build_seconds, "results": results})
+        connection.close_all_connections()
+    return report
+
+
+def compare(report, baseline, threshold, min_delta_ms=0.5):
+    """Return (size, case, old p95, new p95) for every case slower than threshold x baseline.
+
+    Slowdowns smaller than min_delta_ms are ignored; sub-millisecond cases
+    jitter by more than any sensible threshold.
+    """
+    old = {(d["size"], name): r for d in baseline["datasets"] for name, r in d["results"].items()}
+    regressions = []
+    for dataset in report["datasets"]:
+        for name, result in dataset["results"].items():
+            before = old.get((dataset["size"], name))
+            if (before and result["p95_ms"] > before["p95_ms"] * threshold
+                    and result["p95_ms"] - before["p95_ms"] >= min_delta_ms):
+                regressions.append((dataset["size"], name, before["p95_ms"], result["p95_ms"]))
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["50k"])
+    parser.add_argument("--repeat", type=int, default=200, help="samples per case (some heavy cases use fewer)")
+    parser.add_argument("--workdir", default="bench_data")
+    parser.add_argument("--rebuild", action="store_true", help="regenerate the databases")
+    parser.add_argument("--only", nargs="+", help="run only cases whose name contains one of these")
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON report to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.25, help="p95 slowdown factor counted as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="ignore p95 slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, args.repeat, args.workdir, rebuild=args.rebuild, only=args.only)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold, args.min_delta_ms)
+        for size, name, before, after in regressions:
+            print(f"REGRESSION [{size}] {name}: p95 {before:.3f} ms -> {after:.3f} ms", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,41 @@
-import flet as ft
-from db import get_books_paginated, get_total_books_count, insert_book, update_book, delete_book, \
-    search_books, export_books, get_copy_summary, update_inventory, find_book_by_title
-
+import os
+import sqlite3
 
-def create_books_tab(page, show_snack_bar):
+import flet as ft
+from backend import get_books_after, get_books_before, get_books_page_cursor, get_total_books_count, insert_book, \
+    update_book, delete_book, search_books_page, search_books_page_cursor, count_search_results, \
+    get_inventory, adjust_inventory, find_book_by_title, find_duplicate_isbns, get_facet_counts, FACETS, \
+    INVENTORY_FIELDS
+from connection import is_busy_error
+from executor import db_executor
+from export import start_export, ExportCancelled
+from importer import import_books
+from table_view import PooledTable
+from validation import parse_book
+
+
+def create_books_tab(page, show_snack_bar, on_page_loaded=None):
     # We'll move all book-related code here
     selected_book_id = None
     current_page = 1
     page_size = 100
-    total_books = get_total_books_count()
+    # How to reach the visible page: ("page", n) jumps through the sparse
+    # page index, ("after", key)/("before", key) seek from a neighbouring
+    # row. Keys are book ids while browsing, (value, id) pairs while sorted
+    # by a column and (score, id) pairs while a search is active.
+    page_request = ("page", 1)
+    page_loaded = False
+    first_key = None
+    last_key = None
+    total_books = 0  # set by the first page load, which runs in the background
     show_form = False
-    filtered_books = None
+    search_term = None
+    search_exact = False
+    search_fuzzy = False
+    # Sidebar filters: ticked values per facet, plus the year range and
+    # translator choice. They apply to browsing and searching alike.
+    selected = {facet: set() for facet in FACETS}
+    sort = None  # e.g. "title" or "-pub_date"; search results stay in relevance order
 
     # Form fields for book data input
     fields = {
@@ -45,34 +70,15 @@ def create_books_tab(page, show_snack_bar):
 
     def fill_form(book):
         nonlocal selected_book_id, show_form
-        selected_book_id = book[0]
+        selected_book_id = book.id
         show_form = True
         form_section.visible = True
-        for key, value in zip(fields.keys(), book[1:]):
-            fields[key].value = str(value or "")
+        for key, field in fields.items():
+            field.value = str(getattr(book, key) or "")
         page.update()
 
     def parse_book_form():
-        data = {}
-        errors = []
-        for k, f in fields.items():
-            val = f.value
-            if k == "book_number":
-                try:
-                    data[k] = int(val.strip()) if val and str(val).strip().isdigit() else None
-                except:
-                    data[k] = None
-            else:
-                data[k] = val.strip() if isinstance(val, str) else ""
-
-        if not data["title"]:
-            errors.append("title")
-        if not data["author"]:
-            errors.append("author")
-        if data["book_number"] is None:
-            errors.append("book_number")
-
-        return data, errors
+        return parse_book({k: f.value for k, f in fields.items()})
 
     def highlight_errors(errors):
         for k in fields:
@@ -85,109 +91,243 @@ def create_books_tab(page, show_snack_bar):
         data, errors = parse_book_form()
         if errors:
             highlight_errors(errors)
-            show_snack_bar("Please fill all required fields.")
+            if errors == ["isbn"]:
+                show_snack_bar("⚠️ ISBN is not a valid ISBN-10 or ISBN-13.")
+            else:
+                show_snack_bar("Please fill all required fields.")
             return
 
-        try:
-            # Check title uniqueness
-            existing = find_book_by_title(data["title"])
-            if existing and (not selected_book_id or existing[0] != selected_book_id):
-                highlight_errors(["title"])
-                book_number = existing[1]
-                show_snack_bar(f"⚠️ A book with this title already exists (Book Number: {book_number}).")
-                return
+        book_id = selected_book_id
 
-            if selected_book_id:
-                update_book(selected_book_id, data)
+        def save():
+            # Check title uniqueness; the ISBN is checked by the save itself
+            existing = find_book_by_title(data["title"])
+            if existing and (not book_id or existing.id != book_id):
+                return existing
+            if book_id:
+                update_book(book_id, data)
             else:
                 insert_book(data)
+            return None
 
+        def on_saved(existing):
+            if existing:
+                highlight_errors(["title"])
+                book_number = existing.book_number
+                show_snack_bar(f"⚠️ A book with this title already exists (Book Number: {book_number}).")
+                return
             clear_fields()
             refresh_books()
 
-        except Exception as ex:
-            import sqlite3
-            if isinstance(ex, sqlite3.IntegrityError):
+        def on_error(ex):
+            if isinstance(ex, ValueError) and "ISBN" in str(ex):
+                highlight_errors(["isbn"])
+                show_snack_bar(f"⚠️ {ex}.")
+            elif isinstance(ex, sqlite3.IntegrityError):
                 highlight_errors(["book_number"])
                 show_snack_bar("⚠️ Book number must be unique.")
             else:
-                show_snack_bar(f"Error: {ex}")
+                show_error(ex)
 
-    def update_table():
-        book_table.rows.clear()
-        nonlocal total_books
+        db_executor.submit(save, on_done=on_saved, on_error=on_error)
 
-        if filtered_books is not None:
-            total_books = len(filtered_books)
-            books = filtered_books[(current_page - 1) * page_size: current_page * page_size]
+    def show_error(ex):
+        loading_bar.visible = False
+        if is_busy_error(ex):
+            show_snack_bar("⚠️ The database is busy with another program's changes. Please try again.")
         else:
-            total_books = get_total_books_count()
-            books = get_books_paginated(current_page, page_size)
+            show_snack_bar(f"Error: {ex}")
+        page.update()
 
-        total_pages = max(1, (total_books + page_size - 1) // page_size)
+    def update_table(recount=False):
+        nonlocal page_loaded
+        # Snapshot the request: the worker must fetch exactly what was asked
+        # for even if the user clicks on before it runs.
+        term, exact, fuzzy, size = search_term, search_exact, search_fuzzy, page_size
+        filters = current_filters()
+        order = sort
+        kind, value = page_request
+
+        def fetch():
+            nonlocal kind, value
+            if kind == "page":
+                if term is not None:
+                    kind, value = "after", search_books_page_cursor(term, exact, value, size, filters=filters,
+                                                                        fuzzy=fuzzy)
+                else:
+                    kind, value = "after", get_books_page_cursor(value, size, filters=filters, sort=order)
+            if term is not None:
+                rows, keys = search_books_page(term, exact, value, size, before=kind == "before", filters=filters,
+                                               fuzzy=fuzzy)
+                # Counted once per search; page turns only fetch the visible rows
+                total = count_search_results(term, exact, filters=filters, fuzzy=fuzzy) if recount else None
+            else:
+                if kind == "before":
+                    rows = get_books_before(value, size, filters=filters, sort=order)
+                else:
+                    rows = get_books_after(value, size, filters=filters, sort=order)
+                keys = (row_key(rows[0], order), row_key(rows[-1], order)) if rows else (None, None)
+                # A filtered count is a query, so like a search it's taken once
+                total = get_total_books_count(filters) if recount or not filters else None
+            facets = get_facet_counts(term, exact, filters, fuzzy) if recount else None
+            return rows, keys, total, facets
+
+        page_loaded = False
+        loading_bar.visible = True
+        page.update()
+        db_executor.submit(fetch, key="books.page", on_done=render_table, on_error=show_error)
+
+    def row_key(book, order):
+        return (getattr(book, order.lstrip("-")), book.id) if order else book.id
 
-        for index, book in enumerate(books):
-            book_id = book[0]
-            status = book[10]
-            status_colors = {
-                "Available": ft.Colors.GREEN_400,
-                "Not Available": ft.Colors.AMBER_600,
-                "Missing": ft.Colors.RED_500,
-            }
-            colored_status = ft.Text(status, color=status_colors.get(status, ft.Colors.GREY_600))
-
-            data_cells = [ft.DataCell(ft.Text(str(cell))) for cell in book[0:10]]
-            data_cells[-1] = ft.DataCell(colored_status)
-            data_cells.append(ft.DataCell(ft.Row([
-                ft.IconButton(icon="PERSON", tooltip="Summary", on_click=create_summary_callback(book_id),
-                              icon_color="green400"),
-                ft.IconButton(icon="edit", tooltip="Edit", on_click=create_edit_callback(book), icon_color="orange400"),
-                ft.IconButton(icon="delete", tooltip="Delete", on_click=create_delete_callback(book_id),
-                              icon_color="red400")
-            ], wrap=False)))
-
-            row_color = "grey100" if index % 2 == 0 else "white"
-            book_table.rows.append(ft.DataRow(cells=data_cells, color=row_color))
+    def render_table(result):
+        nonlocal page_loaded, total_books, first_key, last_key
+        books, (first_key, last_key), total, facets = result
+        if total is not None:
+            total_books = total
+        book_table.sort_column_index = sort_columns.index(sort.lstrip("-")) if sort and search_term is None else None
+        book_table.sort_ascending = not (sort or "").startswith("-")
+        if facets is not None:
+            render_facets(facets)
+
+        total_pages = max(1, (total_books + page_size - 1) // page_size)
+        book_rows.show(books)
 
         page_label.value = f"Page {current_page} of {total_pages} | Total: {total_books}"
+        page_loaded = True
+        loading_bar.visible = False
         page.update()
+        if on_page_loaded:
+            on_page_loaded()
+
+    def render_facets(facets):
+        controls = []
+        for facet, counts in facets.items():
+            # Keep ticked values visible even when nothing matches them any more
+            shown = {value for value, _ in counts}
+            counts = counts + [(value, 0) for value in sorted(selected[facet] - shown)]
+            controls.append(ft.Text(facet.capitalize(), weight=ft.FontWeight.BOLD))
+            controls.extend(
+                ft.Row([ft.Checkbox(label=value or "(none)", value=value in selected[facet], expand=True,
+                                    on_change=lambda e, f=facet, v=value: toggle_facet(f, v, e.control.value)),
+                        ft.Text(str(count), size=13, color=ft.Colors.GREY_600)])
+                for value, count in counts)
+            controls.append(ft.Divider(height=8, color=ft.Colors.TRANSPARENT))
+        facet_column.controls = controls
+
+    def current_filters():
+        filters = {facet: sorted(values) for facet, values in selected.items() if values}
+        if year_from.value.strip():
+            filters["pub_from"] = year_from.value.strip()
+        if year_to.value.strip():
+            filters["pub_to"] = year_to.value.strip()
+        if translator_filter.value != "any":
+            filters["has_translator"] = translator_filter.value == "with"
+        return filters
+
+    def apply_filters(e=None):
+        for field in (year_from, year_to):
+            year = field.value.strip()
+            field.error_text = None if not year or (year.isdigit() and len(year) == 4) else "YYYY"
+        if year_from.error_text or year_to.error_text:
+            page.update()
+            return
+        refresh_books(search_term, search_exact, search_fuzzy)
+
+    def toggle_facet(facet, value, checked):
+        if checked:
+            selected[facet].add(value)
+        else:
+            selected[facet].discard(value)
+        apply_filters()
+
+    def clear_filters(e):
+        for values in selected.values():
+            values.clear()
+        year_from.value = year_to.value = ""
+        translator_filter.value = "any"
+        apply_filters()
+
+    def handle_sort(e):
+        nonlocal sort
+        if search_term is not None:
+            show_snack_bar("Search results are listed by relevance. Clear the search to sort.")
+            return
+        column = sort_columns[e.column_index]
+        sort = column if e.ascending else f"-{column}"
+        refresh_books()
 
-    def refresh_books(filtered=None):
-        nonlocal filtered_books, current_page
-        current_page = 1
-        filtered_books = filtered
-        update_table()
+    def set_page(number):
+        nonlocal current_page, page_request
+        current_page = number
+        page_request = ("page", number)
+
+    def refresh_books(term=None, exact=False, fuzzy=False):
+        nonlocal search_term, search_exact, search_fuzzy
+        search_term, search_exact, search_fuzzy = term, exact, fuzzy
+        set_page(1)
+        update_table(recount=True)
 
     def handle_search(e):
         term = search_input.value.strip()
         is_exact = exact_search_toggle.value
 
         if term:
-            results = search_books(term, exact=is_exact)
-            refresh_books(results)
+            refresh_books(term, is_exact, fuzzy_search_toggle.value)
         else:
-            refresh_books(None)
+            refresh_books()
 
-    def create_summary_callback(book_id):
-        def show_summary(e):
-            summary = get_copy_summary(book_id)
-            create_summary_dialog(summary)
+    def toggle_match_mode(e):
+        # Exact and fuzzy matching exclude each other
+        other = fuzzy_search_toggle if e.control is exact_search_toggle else exact_search_toggle
+        if e.control.value and other.value:
+            other.value = False
+            page.update()
 
-        return show_summary
+    def show_summary(book_id):
+        db_executor.submit(get_inventory, book_id, key="books.summary",
+                           on_done=create_summary_dialog, on_error=show_error)
 
-    def create_summary_dialog(summary):
+    def create_summary_dialog(inventory):
+        # Lent copies are moved by checkout/checkin, so they're shown but not editable
         inputs = {
-            k: ft.TextField(value=str(summary.get(k, 0)), width=70, text_align=ft.TextAlign.CENTER, dense=True)
-            for k in ["Available", "Lent", "Missing", "Damaged"]
+            k: ft.TextField(value=str(getattr(inventory, k)), width=70, text_align=ft.TextAlign.CENTER, dense=True,
+                            read_only=k == "lent", tooltip="Changed by loans" if k == "lent" else None)
+            for k in INVENTORY_FIELDS
         }
 
-        def save_inventory(e):
-            update_inventory(selected_book_id, **{k.lower(): int(v.value or 0) for k, v in inputs.items()})
+        def on_saved(_):
             page.dialog.open = False
             show_snack_bar("Inventory updated successfully!", ft.Colors.GREEN_100)
             refresh_books()
             page.update()
 
+        def on_save_error(ex):
+            if isinstance(ex, sqlite3.IntegrityError):
+                show_snack_bar("⚠️ Counts changed meanwhile and would go below zero; reopen the summary.")
+            else:
+                show_error(ex)
+
+        def save_inventory(e):
+            try:
+                counts = {k: int(v.value or 0) for k, v in inputs.items()}
+            except ValueError:
+                show_snack_bar("Counts must be whole numbers.")
+                return
+            if any(v < 0 for v in counts.values()):
+                show_snack_bar("Counts can't be negative.")
+                return
+            # Save what the user changed relative to what the dialog showed,
+            # so a concurrent save from someone else isn't overwritten
+            deltas = {k: counts[k] - getattr(inventory, k) for k in inputs
+                      if k != "lent" and counts[k] != getattr(inventory, k)}
+            if not deltas:
+                page.dialog.open = False
+                page.update()
+                return
+            db_executor.submit(adjust_inventory, inventory.book_id, **deltas, on_done=on_saved,
+                               on_error=on_save_error)
+
         dialog = ft.AlertDialog(
             modal=True,
             title=ft.Text("📦 Inventory Summary", size=16, weight=ft.FontWeight.BOLD),
@@ -195,7 +335,7 @@ def create_books_tab(page, show_snack_bar):
                 padding=10,
                 content=ft.Column([
                     ft.Row(
-                        [ft.Column([ft.Text(k, size=14), v]) for k, v in inputs.items()],
+                        [ft.Column([ft.Text(k.capitalize(), size=14), v]) for k, v in inputs.items()],
                         alignment=ft.MainAxisAlignment.SPACE_EVENLY,
                         spacing=10
                     ),
@@ -215,47 +355,146 @@ def create_books_tab(page, show_snack_bar):
         page.dialog.open = True
         page.update()
 
-    def create_edit_callback(book):
-        return lambda e: fill_form(book)
+    def delete(book_id):
+        db_executor.submit(delete_book, book_id, on_done=lambda _: refresh_books(), on_error=show_error)
+
+    def show_duplicates(e):
+        loading_bar.visible = True
+        page.update()
+        db_executor.submit(find_duplicate_isbns, key="books.duplicates", on_done=create_duplicates_dialog,
+                           on_error=show_error)
+
+    def create_duplicates_dialog(report):
+        loading_bar.visible = False
+        lines = []
+        for isbn13, books in report["duplicates"]:
+            lines.append(ft.Text(f"ISBN {isbn13}", weight=ft.FontWeight.BOLD))
+            lines += [ft.Text(f"    #{number}  {title}  ({isbn})", size=13) for _, number, title, isbn in books]
+        if report["invalid"]:
+            lines.append(ft.Text("Invalid ISBNs", weight=ft.FontWeight.BOLD))
+            lines += [ft.Text(f"    #{number}  {title}  ({isbn})", size=13)
+                      for _, number, title, isbn in report["invalid"]]
+        if not lines:
+            lines.append(ft.Text("No duplicate or invalid ISBNs found."))
+
+        dialog = ft.AlertDialog(
+            modal=True,
+            title=ft.Text(f"🔁 Duplicate ISBNs ({len(report['duplicates'])} groups, {len(report['invalid'])} invalid)",
+                          size=16, weight=ft.FontWeight.BOLD),
+            content=ft.Container(
+                padding=10,
+                content=ft.ListView(lines, spacing=4),
+                width=600,
+                height=400
+            ),
+            actions=[ft.TextButton("Close", on_click=lambda e: (setattr(page.dialog, 'open', False), page.update()))]
+        )
+
+        page.dialog = dialog
+        page.dialog.open = True
+        page.update()
 
-    def create_delete_callback(book_id):
-        return lambda e: (delete_book(book_id), refresh_books())
+    def format_book_row(book):
+        status = book.status
+        cells = [(str(getattr(book, name)), None) for name in table_fields]
+        cells.append((status, status_colors.get(status, ft.Colors.GREY_600)))
+        return cells
 
     def go_to_page(e):
-        nonlocal current_page
         try:
             req = int(page_input.value.strip())
             max_pages = max(1, (total_books + page_size - 1) // page_size)
             if 1 <= req <= max_pages:
-                current_page = req
+                set_page(req)
                 update_table()
         except:
             pass
 
     def change_page_size(e):
-        nonlocal page_size, current_page
+        nonlocal page_size
         try:
             page_size = int(page_size_dropdown.value)
-            current_page = 1
+            set_page(1)
             update_table()
         except:
             pass
 
     def prev_page(e):
-        nonlocal current_page
+        nonlocal current_page, page_request
         if current_page > 1:
-            current_page -= 1
+            if page_loaded and first_key is not None and current_page > 2:
+                current_page -= 1
+                page_request = ("before", first_key)
+            else:
+                set_page(current_page - 1)
             update_table()
 
     def next_page(e):
-        nonlocal current_page
+        nonlocal current_page, page_request
         if current_page < max(1, (total_books + page_size - 1) // page_size):
-            current_page += 1
+            if page_loaded:
+                current_page += 1
+                page_request = ("after", last_key)
+            else:
+                # The visible page hasn't arrived yet, so its keys are stale
+                set_page(current_page + 1)
             update_table()
 
     def handle_export(e):
-        export_books()
-        show_snack_bar("Books exported to Excel.", ft.Colors.BLUE_100)
+        if not e.path:
+            return
+        path = e.path if os.path.splitext(e.path)[1] else e.path + ".xlsx"
+        task_status.value = "Exporting..."
+        task_cancel.visible = True
+        task_row.visible = True
+        page.update()
+
+        def on_progress(done, total):
+            task_status.value = f"Exporting... {done} of {total} books"
+            page.update()
+
+        def on_finished(message, color=ft.Colors.BLUE_100):
+            task_row.visible = False
+            task_cancel.visible = False
+            show_snack_bar(message, color)
+            page.update()
+
+        def on_error(ex):
+            if isinstance(ex, ExportCancelled):
+                on_finished("Export cancelled.", ft.Colors.GREY_300)
+            else:
+                on_finished(f"Export failed: {ex}", ft.Colors.RED_300)
+
+        cancel = start_export(path, progress=on_progress, on_error=on_error,
+                              on_done=lambda p, rows: on_finished(f"Exported {rows} books to {os.path.basename(p)}."))
+        task_cancel.on_click = lambda e: cancel.set()
+
+    def handle_import(e):
+        if not e.files:
+            return
+        task_status.value = "Importing..."
+        task_row.visible = True
+        page.update()
+
+        def on_progress(processed, inserted, failed):
+            task_status.value = f"Importing... {inserted} added, {failed} rejected ({processed} rows read)"
+            page.update()
+
+        def on_done(report):
+            task_row.visible = False
+            message = f"Imported {report['inserted']} books."
+            if report["errors"]:
+                line, reason = report["errors"][0]
+                message += f" {len(report['errors'])} rows rejected (first: line {line}: {reason})."
+            show_snack_bar(message, ft.Colors.BLUE_100)
+            refresh_books()
+
+        def on_error(ex):
+            task_row.visible = False
+            show_snack_bar(f"Import failed: {ex}")
+            refresh_books()
+
+        db_executor.submit(import_books, e.files[0].path, progress=on_progress, on_done=on_done, on_error=on_error)
 
     def toggle_form(e):
         nonlocal show_form
@@ -264,24 +503,72 @@ def create_books_tab(page, show_snack_bar):
         page.update()
 
     # UI elements
-    search_input = ft.TextField(label="Search by title, author, or book number", expand=True, on_submit=handle_search)
-    exact_search_toggle = ft.Checkbox(label="Exact match", value=False)
+    search_input = ft.TextField(label="Search by title, author, ISBN or book number", expand=True, on_submit=handle_search)
+    exact_search_toggle = ft.Checkbox(label="Exact match", value=False, on_change=toggle_match_mode)
+    fuzzy_search_toggle = ft.Checkbox(label="Fuzzy", value=False, tooltip="Tolerate typos in titles and authors",
+                                      on_change=toggle_match_mode)
     page_input = ft.TextField(label="Go to page", width=150, on_submit=go_to_page)
     page_size_dropdown = ft.Dropdown(label="Page size", width=120, value=str(page_size),
                                      options=[ft.dropdown.Option(str(n)) for n in [50, 100, 250]],
                                      on_change=change_page_size)
 
+    # Column each header sorts by (None: not sortable); each has an index
+    sort_columns = [None, "book_number", "title", "author", None, "pub_date", None, None, None, None, None]
     book_table = ft.DataTable(
-        columns=[ft.DataColumn(label=ft.Text(h)) for h in
-                 ["ID", "Book Number", "Title", "Author", "Translator", "Pub Date", "ISBN", "Language", "Genre",
-                  "Status", "Actions"]],
+        columns=[ft.DataColumn(label=ft.Text(h), on_sort=handle_sort if column else None)
+                 for h, column in zip(["ID", "Book Number", "Title", "Author", "Translator", "Pub Date", "ISBN",
+                                       "Language", "Genre", "Status", "Actions"], sort_columns)],
         rows=[], expand=True
     )
 
-    table_container = ft.Container(content=ft.Column([book_table], scroll=ft.ScrollMode.ALWAYS, expand=True),
-                                   bgcolor=ft.Colors.GREY_100, expand=True)
+    # Book attributes shown in the table, in column order (status is added with its colour)
+    table_fields = ["id", "book_number", "title", "author", "translator", "pub_date", "isbn", "language", "genre"]
+    status_colors = {
+        "Available": ft.Colors.GREEN_400,
+        "Not Available": ft.Colors.AMBER_600,
+        "Missing": ft.Colors.RED_500,
+    }
+    book_rows = PooledTable(book_table, format_book_row, actions=[
+        ("PERSON", "Summary", "green400", lambda book: show_summary(book.id)),
+        ("edit", "Edit", "orange400", fill_form),
+        ("delete", "Delete", "red400", lambda book: delete(book.id)),
+    ])
+
+    loading_bar = ft.ProgressBar(visible=False)
+    table_container = ft.Container(
+        content=ft.Column([loading_bar, book_table], scroll=ft.ScrollMode.ALWAYS, expand=True),
+        bgcolor=ft.Colors.GREY_100, expand=True)
     page_label = ft.Text()
 
+    # Filters, and books per genre/language/status for the whole catalog or
+    # the current search
+    year_from = ft.TextField(label="From year", hint_text="YYYY", dense=True, expand=True,
+                             on_submit=apply_filters)
+    year_to = ft.TextField(label="To year", hint_text="YYYY", dense=True, expand=True,
+                           on_submit=apply_filters)
+    translator_filter = ft.Dropdown(label="Translator", value="any", dense=True, on_change=apply_filters,
+                                    options=[ft.dropdown.Option("any", "Any"), ft.dropdown.Option("with", "Translated"),
+                                             ft.dropdown.Option("without", "Not translated")])
+    facet_column = ft.Column(spacing=2)
+    facet_sidebar = ft.Container(
+        content=ft.Column([
+            ft.Row([ft.Text("Filters", weight=ft.FontWeight.BOLD, expand=True),
+                    ft.TextButton("Clear", on_click=clear_filters)]),
+            ft.Row([year_from, year_to], spacing=4),
+            translator_filter,
+            ft.Divider(height=8, color=ft.Colors.TRANSPARENT),
+            facet_column,
+        ], scroll=ft.ScrollMode.AUTO, spacing=6),
+        width=220, padding=8, bgcolor=ft.Colors.GREY_50)
+
+    import_picker = ft.FilePicker(on_result=handle_import)
+    page.overlay.append(import_picker)
+    export_picker = ft.FilePicker(on_result=handle_export)
+    page.overlay.append(export_picker)
+    task_status = ft.Text()
+    task_cancel = ft.TextButton("Cancel", visible=False)
+    task_row = ft.Row([ft.ProgressRing(width=16, height=16, stroke_width=2), task_status, task_cancel], visible=False)
+
     column1 = ft.Column([
         fields['book_number'], fields['title'], fields['author'], fields['translator'], fields['pub_date']
     ], expand=True)
@@ -291,7 +578,12 @@ def create_books_tab(page, show_snack_bar):
         ft.Row([
             ft.ElevatedButton("Save", on_click=handle_add_or_update, bgcolor=ft.Colors.GREEN_100),
             ft.ElevatedButton("Clear", on_click=clear_fields, bgcolor=ft.Colors.GREY_200),
-            ft.ElevatedButton("Export", on_click=handle_export, bgcolor=ft.Colors.BLUE_100)
+            ft.ElevatedButton("Export", bgcolor=ft.Colors.BLUE_100,
+                              on_click=lambda e: export_picker.save_file(
+                                  file_name="books_export.xlsx", allowed_extensions=["xlsx", "csv", "parquet"])),
+            ft.ElevatedButton("Import", bgcolor=ft.Colors.BLUE_100,
+                              on_click=lambda e: import_picker.pick_files(allowed_extensions=["csv", "xlsx", "jsonl"])),
+            ft.ElevatedButton("Duplicates", on_click=show_duplicates, bgcolor=ft.Colors.GREY_200)
         ], spacing=10)
     ], expand=True)
 
@@ -310,17 +602,19 @@ def create_books_tab(page, show_snack_bar):
             padding=ft.padding.only(top=8, left=8, right=8)
         ),
         form_section,
+        task_row,
         ft.Divider(height=2, thickness=1, color=ft.Colors.GREY_300),
         ft.Container(
         ft.Row([
             search_input,
             exact_search_toggle,
+            fuzzy_search_toggle,
             ft.ElevatedButton(" Search ", on_click=handle_search, bgcolor=ft.Colors.GREY_200),
             ft.ElevatedButton(" Clear ", on_click=lambda e: (search_input.__setattr__('value', ''), refresh_books()),
                               bgcolor=ft.Colors.GREY_200)
         ], spacing=10),
            padding=ft.padding.only(top=8, left=8, right=8)),
-        table_container,
+        ft.Row([facet_sidebar, table_container], expand=True, vertical_alignment=ft.CrossAxisAlignment.START),
         ft.Row([
             ft.ElevatedButton("Previous", on_click=prev_page, bgcolor=ft.Colors.GREY_200),
             ft.ElevatedButton("Next", on_click=next_page, bgcolor=ft.Colors.GREY_200),
@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """A thread-safe, size-bounded read-through cache.
+
+    `None` results are cached too, so "no such title" lookups are as cheap
+    as hits. Every invalidation bumps an epoch; a value loaded while an
+    invalidation happened is returned but not stored, so a read racing a
+    write can't put a stale entry back.
+
+    With `sizeof`, maxsize bounds the total sizeof(value) of the entries
+    instead of their number, and a value bigger than that is not stored.
+    """
+
+    def __init__(self, maxsize=4096, sizeof=None):
+        self.maxsize = maxsize
+        self._sizeof = sizeof or (lambda value: 1)
+        self._total = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load):
+        """Return the cached value for key, calling load() to fill a miss."""
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is not _MISSING:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+            epoch = self._epoch
+
+        value = load()
+        size = self._sizeof(value)
+        with self._lock:
+            if epoch == self._epoch and size <= self.maxsize and key not in self._data:
+                self._data[key] = value
+                self._total += size
+                while self._total > self.maxsize:
+                    self._total -= self._sizeof(self._data.popitem(last=False)[1])
+        return value
+
+    def _drop(self, key):
+        self._total -= self._sizeof(self._data.pop(key))
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self._epoch += 1
+            for key in keys:
+                if key in self._data:
+                    self._drop(key)
+
+    def invalidate_values(self, value):
+        """Drop every entry that maps to `value` (e.g. all titles of a book id)."""
+        with self._lock:
+            self._epoch += 1
+            for key in [k for k, v in self._data.items() if v == value]:
+                self._drop(key)
+
+    def invalidate_keys(self, predicate):
+        """Drop every entry whose key satisfies predicate(key)."""
+        with self._lock:
+            self._epoch += 1
+            for key in [k for k in self._data if predicate(k)]:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._data.clear()
+            self._total = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,137 @@
+import functools
+import random
+import sqlite3
+import threading
+import time
+
+DB_NAME = "library.db"
+
+# PRAGMAs applied once to every new connection. Values are passed straight to
+# SQLite, so anything accepted by "PRAGMA <name> = <value>" works here.
+PRAGMA_PROFILE = {
+    "busy_timeout": 5000,  # ms to wait for another writer before SQLITE_BUSY; first so it covers the rest
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,  # negative = KiB, i.e. ~64 MB page cache
+    "mmap_size": 268435456,  # 256 MB
+    "temp_store": "MEMORY",
+}
+
+# When the busy timeout still isn't enough (e.g. a deferred transaction's
+# snapshot went stale), writes are retried after a random, growing pause so
+# competing processes don't retry in lockstep
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05  # seconds; attempt n sleeps up to BUSY_BACKOFF * 2**n
+
+_local = threading.local()
+_lock = threading.Lock()
+_connections = set()
+_generation = 0
+_db_name = DB_NAME
+_pragmas = dict(PRAGMA_PROFILE)
+
+
+def configure(db_name=None, pragmas=None):
+    """Point the manager at another database file and/or PRAGMA profile.
+
+    Existing connections are closed so every thread reconnects with the new
+    settings on its next call to get_connection().
+    """
+    global _db_name, _pragmas
+    close_all_connections()
+    if db_name is not None:
+        _db_name = db_name
+    if pragmas is not None:
+        _pragmas = dict(pragmas)
+
+
+def get_db_name():
+    return _db_name
+
+
+class Connection(sqlite3.Connection):
+    """sqlite3.Connection whose `with conn:` blocks can join an outer transaction.
+
+    While `group_commit` is set, leaving a `with conn:` block neither
+    commits nor rolls back; whoever set the flag (the write queue) ends
+    the transaction for the whole group.
+    """
+
+    group_commit = False
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.group_commit:
+            return False
+        return super().__exit__(exc_type, exc, tb)
+
+
+def begin_immediate(cur):
+    """Take the write lock now, unless the connection is already in a transaction."""
+    if not cur.connection.in_transaction:
+        cur.execute("BEGIN IMMEDIATE")
+
+
+def is_busy_error(ex):
+    if not isinstance(ex, sqlite3.OperationalError):
+        return False
+    message = str(ex)
+    return "locked" in message or "busy" in message
+
+
+def retry_on_busy(fn):
+    """Retry fn with jittered exponential backoff while the database is locked."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        for attempt in range(BUSY_RETRIES):
+            try:
+                return fn(*args, **kwargs)
+            except sqlite3.OperationalError as ex:
+                # Inside someone else's transaction a retry would repeat
+                # work that hasn't been rolled back
+                if not is_busy_error(ex) or attempt == BUSY_RETRIES - 1 or get_connection().in_transaction:
+                    raise
+            time.sleep(random.uniform(0, BUSY_BACKOFF * 2 ** attempt))
+    return wrapper
+
+
+def _open():
+    # Each connection is only ever used by the thread that opened it;
+    # check_same_thread is off so close_all_connections() can close it.
+    conn = sqlite3.connect(_db_name, check_same_thread=False, factory=Connection)
+    for name, value in _pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def get_connection():
+    """Return the long-lived connection owned by the calling thread."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation:
+        conn = _open()
+        _local.conn = conn
+        _local.generation = _generation
+        with _lock:
+            _connections.add(conn)
+    return conn
+
+
+def close_connection():
+    """Close the calling thread's connection, if it has one."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        with _lock:
+            _connections.discard(conn)
+        conn.close()
+
+
+def close_all_connections():
+    """Close every open connection; threads reconnect lazily afterwards."""
+    global _generation
+    with _lock:
+        conns = list(_connections)
+        _connections.clear()
+        _generation += 1
+    _local.conn = None
+    for conn in conns:
+        conn.close()
@@ -1,12 +1,123 @@
+import re
 import sqlite3
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from difflib import SequenceMatcher
+from datetime import date, timedelta
 
-DB_NAME = "library.db"  # Changed to single database file
+from cache import LRUCache
+from connection import begin_immediate, get_connection, retry_on_busy
+from instrumentation import instrument_module
+from models import BookColumns, Book, Inventory, book_factory, user_factory
+from validation import normalize_isbn
 
+# Keep books_fts in step with every write to books
+_FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts (rowid, title, author, translator, isbn)
+        VALUES (new.id, new.title, new.author, new.translator, new.isbn);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts (books_fts, rowid, title, author, translator, isbn)
+        VALUES ('delete', old.id, old.title, old.author, old.translator, old.isbn);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF title, author, translator, isbn ON books BEGIN
+        INSERT INTO books_fts (books_fts, rowid, title, author, translator, isbn)
+        VALUES ('delete', old.id, old.title, old.author, old.translator, old.isbn);
+        INSERT INTO books_fts (rowid, title, author, translator, isbn)
+        VALUES (new.id, new.title, new.author, new.translator, new.isbn);
+    END
+    """,
+]
+
+# Exact row counts for the tables the UI pages through, so totals are a
+# single-row lookup instead of COUNT(*)
+_COUNTED_TABLES = ["books", "users"]
+_COUNT_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_count_{suffix} AFTER {event} ON {table} BEGIN
+        UPDATE row_counts SET count = count {op} 1 WHERE table_name = '{table}';
+    END
+    """
+    for table in _COUNTED_TABLES
+    for suffix, event, op in [("ai", "INSERT", "+"), ("ad", "DELETE", "-")]
+]
+
+# Per-value book counts for the filter sidebar. NULL is stored as '' (the
+# primary key can't hold NULL); an update moves a book from its old values
+# to its new ones. Rows that drop to zero stay and are filtered on read.
+FACETS = ["genre", "language", "status"]
+_FACET_ADD = "".join(
+    f"""
+        INSERT INTO book_facets (facet, value, count) VALUES ('{f}', IFNULL(new.{f}, ''), 1)
+        ON CONFLICT (facet, value) DO UPDATE SET count = count + 1;"""
+    for f in FACETS)
+_FACET_REMOVE = "".join(
+    f"""
+        UPDATE book_facets SET count = count - 1 WHERE facet = '{f}' AND value = IFNULL(old.{f}, '');"""
+    for f in FACETS)
+_FACET_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS books_facets_ai AFTER INSERT ON books BEGIN{_FACET_ADD}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS books_facets_ad AFTER DELETE ON books BEGIN{_FACET_REMOVE}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS books_facets_au AFTER UPDATE OF {", ".join(FACETS)} ON books BEGIN{_FACET_REMOVE}{_FACET_ADD}
+    END
+    """,
+]
+
+# Fuzzy search keeps its own word list (search_terms/search_grams), filled
+# from the books queued here by _index_search_terms()
+_TERM_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS books_terms_ai AFTER INSERT ON books BEGIN
+        INSERT OR IGNORE INTO search_terms_pending (book_id) VALUES (new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_terms_au AFTER UPDATE OF title, author ON books BEGIN
+        INSERT OR IGNORE INTO search_terms_pending (book_id) VALUES (new.id);
+    END
+    """,
+]
 
-def create_tables():
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
 
+def _add_facet_counts(cur, where="true", params=()):
+    """Add the facet values of the books matching `where` to book_facets."""
+    for facet in FACETS:
+        # The WHERE clause keeps ON CONFLICT from parsing as a join constraint
+        cur.execute(f"""
+                    INSERT INTO book_facets (facet, value, count)
+                    SELECT '{facet}', IFNULL({facet}, ''), COUNT(*)
+                    FROM books
+                    WHERE {where}
+                    GROUP BY 2
+                    ON CONFLICT (facet, value) DO UPDATE SET count = count + excluded.count
+                    """, params)
+
+
+# ===== SCHEMA MIGRATIONS =====
+# The schema version lives in PRAGMA user_version. Each migration is
+# (version, description, apply(cursor), online_indexes): apply() runs with
+# every other pending migration in one transaction, while the
+# online_indexes are only queued in schema_pending_indexes and built later
+# by build_pending_indexes(), one index per transaction, so adding an index
+# to a big table doesn't hold up startup. Append new migrations to the end
+# of MIGRATIONS; never edit one that has shipped.
+def _migration_1(cur):
+    """Baseline schema (idempotent, so databases from before versioning upgrade cleanly)."""
     # Books table
     cur.execute('''
                 CREATE TABLE IF NOT EXISTS books
@@ -58,39 +169,762 @@ def create_tables():
     cur.execute("CREATE INDEX IF NOT EXISTS idx_users_name ON users(name)")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)")
 
-    conn.commit()
-    conn.close()
+    # Full-text index over the searchable book columns (external content,
+    # so the text itself is only stored once in books)
+    try:
+        fts_exists = cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'").fetchone()
+        cur.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5
+                    (
+                        title, author, translator, isbn,
+                        content='books', content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2'
+                    )
+                    ''')
+        for trigger in _FTS_TRIGGERS:
+            cur.execute(trigger)
+        if not fts_exists:
+            cur.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5; search_books falls back to LIKE
+        pass
+
+    # Cached row counts, seeded once from COUNT(*) and then kept exact by triggers
+    cur.execute('''
+                CREATE TABLE IF NOT EXISTS row_counts
+                (
+                    table_name TEXT PRIMARY KEY,
+                    count      INTEGER NOT NULL
+                )
+                ''')
+    for table in _COUNTED_TABLES:
+        if not cur.execute("SELECT 1 FROM row_counts WHERE table_name = ?", (table,)).fetchone():
+            cur.execute(f"INSERT INTO row_counts (table_name, count) SELECT ?, COUNT(*) FROM {table}", (table,))
+    for trigger in _COUNT_TRIGGERS:
+        cur.execute(trigger)
+
+    # Indexes queued by migrations, see build_pending_indexes
+    cur.execute('''
+                CREATE TABLE IF NOT EXISTS schema_pending_indexes
+                (
+                    name TEXT PRIMARY KEY,
+                    sql  TEXT NOT NULL
+                )
+                ''')
+
+
+def _migration_3(cur):
+    """Loans; the table starts empty, so its indexes are built right away."""
+    cur.execute('''
+                CREATE TABLE IF NOT EXISTS loans
+                (
+                    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                    book_id     INTEGER NOT NULL,
+                    user_id     INTEGER NOT NULL,
+                    loan_date   TEXT    NOT NULL,
+                    due_date    TEXT    NOT NULL,
+                    return_date TEXT,
+                    FOREIGN KEY (book_id) REFERENCES books (id),
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                )
+                ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_loans_user ON loans(user_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_loans_book ON loans(book_id)")
+    # Only open loans can be overdue, so the index stays as small as the
+    # number of books currently out, however long the history gets
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_loans_open_due ON loans(due_date) WHERE return_date IS NULL")
+
+
+def _migration_4(cur):
+    """Rebuild inventory with NOT NULL counts that can't go negative."""
+    cur.execute('''
+                CREATE TABLE inventory_new
+                (
+                    book_id   INTEGER PRIMARY KEY,
+                    available INTEGER NOT NULL DEFAULT 0 CHECK (available >= 0),
+                    lent      INTEGER NOT NULL DEFAULT 0 CHECK (lent >= 0),
+                    missing   INTEGER NOT NULL DEFAULT 0 CHECK (missing >= 0),
+                    damaged   INTEGER NOT NULL DEFAULT 0 CHECK (damaged >= 0),
+                    FOREIGN KEY (book_id) REFERENCES books (id)
+                )
+                ''')
+    # Clamp anything the old table let through
+    cur.execute('''
+                INSERT INTO inventory_new (book_id, available, lent, missing, damaged)
+                SELECT book_id,
+                       MAX(IFNULL(available, 0), 0),
+                       MAX(IFNULL(lent, 0), 0),
+                       MAX(IFNULL(missing, 0), 0),
+                       MAX(IFNULL(damaged, 0), 0)
+                FROM inventory
+                ''')
+    cur.execute("DROP TABLE inventory")
+    cur.execute("ALTER TABLE inventory_new RENAME TO inventory")
+
+
+def _migration_5(cur):
+    """Facet counts, seeded with one GROUP BY per facet and then kept exact by triggers."""
+    cur.execute('''
+                CREATE TABLE IF NOT EXISTS book_facets
+                (
+                    facet TEXT    NOT NULL,
+                    value TEXT    NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (facet, value)
+                ) WITHOUT ROWID
+                ''')
+    _add_facet_counts(cur)
+    for trigger in _FACET_TRIGGERS:
+        cur.execute(trigger)
+
+
+def _migration_7(cur):
+    """Trigram postings of the title and author words, for fuzzy search.
+
+    Every book is queued here; build_pending_indexes() does the indexing.
+    """
+    cur.execute("CREATE TABLE IF NOT EXISTS search_terms (term TEXT PRIMARY KEY, grams INTEGER NOT NULL) WITHOUT ROWID")
+    cur.execute('''
+                CREATE TABLE IF NOT EXISTS search_grams
+                (
+                    gram TEXT NOT NULL,
+                    term TEXT NOT NULL,
+                    PRIMARY KEY (gram, term)
+                ) WITHOUT ROWID
+                ''')
+    cur.execute("CREATE TABLE IF NOT EXISTS search_terms_pending (book_id INTEGER PRIMARY KEY)")
+    cur.execute("INSERT OR IGNORE INTO search_terms_pending (book_id) SELECT id FROM books")
+    for trigger in _TERM_TRIGGERS:
+        cur.execute(trigger)
+
+
+def _migration_8(cur):
+    """Normalised ISBN-13 key (books.isbn13) with a unique index.
+
+    Only the first book of each ISBN gets the key, so existing duplicates
+    don't block the index; find_duplicate_isbns() lists them all.
+    """
+    if "isbn13" not in {row[1] for row in cur.execute("PRAGMA table_info(books)")}:
+        cur.execute("ALTER TABLE books ADD COLUMN isbn13 TEXT")
+    first = {}
+    for book_id, isbn in cur.execute("SELECT id, isbn FROM books WHERE isbn != '' ORDER BY id").fetchall():
+        first.setdefault(normalize_isbn(isbn), book_id)
+    first.pop(None, None)
+    cur.executemany("UPDATE books SET isbn13 = ? WHERE id = ?", sorted(first.items(), key=lambda item: item[1]))
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_books_isbn13 ON books(isbn13) WHERE isbn13 IS NOT NULL")
+
+
+def _migration_9(cur):
+    """Make idx_books_isbn13 non-unique and give every copy its ISBN key.
+
+    The unique index is dropped here and rebuilt without UNIQUE by
+    build_pending_indexes(), which then fills in books.isbn13 for the
+    copies migration 8 left out (see _backfill_isbn13).
+    """
+    cur.execute("DROP INDEX IF EXISTS idx_books_isbn13")
+    cur.execute("CREATE TABLE IF NOT EXISTS isbn13_backfill (last_id INTEGER NOT NULL)")
+    cur.execute("DELETE FROM isbn13_backfill")
+    cur.execute("INSERT INTO isbn13_backfill (last_id) VALUES (0)")
+
+
+MIGRATIONS = [
+    (1, "baseline schema", _migration_1, []),
+    (2, "case-insensitive exact search indexes", None, [
+        "CREATE INDEX IF NOT EXISTS idx_books_title_nocase ON books(title COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS idx_books_author_nocase ON books(author COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS idx_users_name_nocase ON users(name COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS idx_users_email_nocase ON users(email COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS idx_users_phone ON users(phone)",
+    ]),
+    (3, "loans", _migration_3, []),
+    (4, "non-negative inventory counts", _migration_4, []),
+    (5, "facet counts", _migration_5, []),
+    (6, "filter indexes", None, [
+        "CREATE INDEX IF NOT EXISTS idx_books_lang_genre_status_pub ON books(language, genre, status, pub_date)",
+        "CREATE INDEX IF NOT EXISTS idx_books_genre_status_pub ON books(genre, status, pub_date)",
+        "CREATE INDEX IF NOT EXISTS idx_books_status_pub ON books(status, pub_date)",
+        "CREATE INDEX IF NOT EXISTS idx_books_pub_date ON books(pub_date)",
+    ]),
+    (7, "fuzzy search terms", _migration_7, []),
+    (8, "normalised ISBN-13", _migration_8, []),
+    # Not unique: copies entered before the key existed may share an ISBN,
+    # new writes are checked by _claim_isbn instead
+    (9, "non-unique ISBN-13 key for every copy", _migration_9, [
+        "CREATE INDEX IF NOT EXISTS idx_books_isbn13 ON books(isbn13) WHERE isbn13 IS NOT NULL",
+    ]),
+    (10, "translator filter index", None, [
+        "CREATE INDEX IF NOT EXISTS idx_books_has_translator ON books((IFNULL(translator, '') != ''))",
+    ]),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _index_name(sql):
+    return re.search(r"INDEX IF NOT EXISTS (\w+)", sql).group(1)
+
+
+def get_schema_version():
+    return get_connection().execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate():
+    """Bring the database up to SCHEMA_VERSION; returns the versions applied.
+
+    When the schema is already current this is a single PRAGMA read.
+    """
+    if get_schema_version() >= SCHEMA_VERSION:
+        return []
+    conn = get_connection()
+    applied = []
+    with conn:
+        cur = conn.cursor()
+        # DDL doesn't open a transaction implicitly; take the write lock and
+        # re-read the version in case another process migrated meanwhile
+        cur.execute("BEGIN IMMEDIATE")
+        current = cur.execute("PRAGMA user_version").fetchone()[0]
+        for version, description, apply, online_indexes in MIGRATIONS:
+            if version <= current:
+                continue
+            if apply:
+                apply(cur)
+            cur.executemany("INSERT OR REPLACE INTO schema_pending_indexes (name, sql) VALUES (?, ?)",
+                            [(_index_name(sql), sql) for sql in online_indexes])
+            applied.append(version)
+        cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return applied
+
+
+def has_pending_indexes():
+    conn = get_connection()
+    return any(conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+               for table in ["schema_pending_indexes", "isbn13_backfill", "search_terms_pending"])
+
+
+def build_pending_indexes(progress=None):
+    """Build the indexes queued by migrate(), one transaction per index.
+
+    SQLite can't build an index concurrently with writes, but in WAL mode
+    readers carry on while it runs and writers only wait for one index at
+    a time. Queries are correct without the indexes, just slower, so this
+    is safe to run in the background after startup. `progress(name)` is
+    called after each index. The ISBN keys that migration 8 left out are
+    filled in next, and the fuzzy search word list is brought up to
+    date last.
+    """
+    conn = get_connection()
+    while True:
+        row = conn.execute("SELECT name, sql FROM schema_pending_indexes ORDER BY rowid LIMIT 1").fetchone()
+        if row is None:
+            break
+        name, sql = row
+        with conn:
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute(sql)
+            cur.execute("DELETE FROM schema_pending_indexes WHERE name = ?", (name,))
+            cur.execute("ANALYZE " + name)
+        if progress:
+            progress(name)
+    _backfill_isbn13()
+    _index_search_terms()
+
+
+_ISBN_BACKFILL_CHUNK = 10_000
+
+
+@retry_on_busy
+def _backfill_isbn13():
+    """Set books.isbn13 for the books that predate it, one transaction per chunk."""
+    conn = get_connection()
+    while True:
+        with conn:
+            cur = conn.cursor()
+            begin_immediate(cur)
+            row = cur.execute("SELECT last_id FROM isbn13_backfill").fetchone()
+            if row is None:
+                return
+            rows = cur.execute("SELECT id, isbn FROM books WHERE id > ? AND isbn != '' AND isbn13 IS NULL "
+                               "ORDER BY id LIMIT ?", (row[0], _ISBN_BACKFILL_CHUNK)).fetchall()
+            if not rows:
+                cur.execute("DELETE FROM isbn13_backfill")
+                return
+            keys = [(normalize_isbn(isbn), book_id) for book_id, isbn in rows]
+            cur.executemany("UPDATE books SET isbn13 = ? WHERE id = ?", [key for key in keys if key[0]])
+            cur.execute("UPDATE isbn13_backfill SET last_id = ?", (rows[-1][0],))
+
+
+def create_tables():
+    """Migrate and build any pending indexes right away (scripts and tools)."""
+    migrate()
+    build_pending_indexes()
+
+
+# ===== KEYSET PAGINATION =====
+# Pages are addressed by the id of the row just before them instead of an
+# OFFSET, so fetching page 400 costs the same as fetching page 1. Jumping to
+# an arbitrary page uses a sparse index holding the last id of every page,
+# built once per (table, page size) and dropped whenever rows are added or
+# removed.
+#
+# A listing can also be sorted by one of SORT_COLUMNS ("-column" for
+# descending). Its pages are then keyed by (value, id) pairs and walk the
+# column's index, with id breaking ties, so no page needs a sort.
+#
+# The sparse indexes are kept for the most recently used 256 listings, and
+# dropped with the entity caches when another connection changes the
+# database (see _check_data_version).
+_page_bounds = LRUCache(256)
+
+SORT_COLUMNS = {
+    "books": {"title": "title COLLATE NOCASE", "author": "author COLLATE NOCASE", "pub_date": "pub_date",
+              "book_number": "book_number"},
+    "users": {"name": "name COLLATE NOCASE", "email": "email COLLATE NOCASE"},
+}
+
+
+def _sort_column(table, sort):
+    """(column, order expression, descending) for a sort like "-author"."""
+    column = sort.lstrip("-")
+    if column not in SORT_COLUMNS[table]:
+        raise ValueError(f"Can't sort {table} by {column}")
+    return column, SORT_COLUMNS[table][column], sort.startswith("-")
+
+
+def _sorted_segments(expr, desc, key):
+    """WHERE clauses, in order, for the rows after `key` in (expr, id) order.
+
+    SQLite sorts NULLs first ascending and last descending, and a range
+    on the column never matches them, so the NULL rows are a separate
+    segment. The value bound is written as >= plus a tie test so it stays
+    an index seek under COLLATE NOCASE, which row values don't manage.
+    """
+    if key is None:
+        return [("true", ())]
+    value, row_id = key
+    op = "<" if desc else ">"
+    if value is None:
+        nulls = (f"{expr} IS NULL AND id {op} ?", (row_id,))
+        return [nulls] if desc else [nulls, (f"{expr} IS NOT NULL", ())]
+    after = (f"{expr} {op}= ? AND ({expr} {op} ? OR id {op} ?)", (value, value, row_id))
+    return [after, (f"{expr} IS NULL", ())] if desc else [after]
+
+
+def _sorted_page(table, columns, expr, desc, key, page_size, row_factory, where, params):
+    direction = "DESC" if desc else "ASC"
+    cur = get_connection().cursor()
+    cur.row_factory = row_factory
+    rows = []
+    for clause, args in _sorted_segments(expr, desc, key):
+        if len(rows) >= page_size:
+            break
+        cur.execute(f"SELECT {columns} FROM {table} WHERE {clause} {where} "
+                    f"ORDER BY {expr} {direction}, id {direction} LIMIT ?", args + params + (page_size - len(rows),))
+        rows += cur.fetchall()
+    return rows
+
+
+def _keyset_page(table, columns, after_id=None, before_id=None, page_size=100, row_factory=None, where="",
+                 params=(), sort=None):
+    """One page of `table` in id order; `where`/`params` optionally narrow the rows.
+
+    With `sort` the page follows that order instead, and after_id/before_id
+    are (value, id) keys.
+    """
+    where = f"AND ({where})" if where else ""
+    if sort:
+        _, expr, desc = _sort_column(table, sort)
+        if before_id is not None:
+            return _sorted_page(table, columns, expr, not desc, tuple(before_id), page_size, row_factory, where,
+                                params)[::-1]
+        return _sorted_page(table, columns, expr, desc, None if after_id is None else tuple(after_id), page_size,
+                            row_factory, where, params)
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.row_factory = row_factory
+    if before_id is not None:
+        cur.execute(f"""
+                    SELECT * FROM (SELECT {columns} FROM {table}
+                                   WHERE id < ? {where} ORDER BY id DESC LIMIT ?)
+                    ORDER BY id
+                    """, (before_id,) + params + (page_size,))
+    elif after_id is not None:
+        cur.execute(f"SELECT {columns} FROM {table} WHERE id > ? {where} ORDER BY id LIMIT ?",
+                    (after_id,) + params + (page_size,))
+    else:
+        cur.execute(f"SELECT {columns} FROM {table} WHERE true {where} ORDER BY id LIMIT ?", params + (page_size,))
+    return cur.fetchall()
+
+
+def _page_cursor(table, page, page_size, where="", params=(), key=None, sort=None):
+    """Return the after_id that starts `page`, or None for the first page.
+
+    A filtered listing passes its `where`/`params` and a `key` to cache its
+    page index under. A sorted one gets a (value, id) key back.
+    """
+    if page <= 1:
+        return None
+    _check_data_version()
+    key = key or ((f"{table}_sort", page_size, sort) if sort else (table, page_size))
+
+    def load():
+        select, order = "id", "id"
+        if sort:
+            column, expr, desc = _sort_column(table, sort)
+            direction = "DESC" if desc else "ASC"
+            select, order = f"{column}, id", f"{expr} {direction}, id {direction}"
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute(f"""
+                    SELECT {select} FROM (SELECT {select}, ROW_NUMBER() OVER (ORDER BY {order}) AS rn FROM {table}
+                                          WHERE {where or "true"})
+                    WHERE rn % ? = 0
+                    ORDER BY rn
+                    """, params + (page_size,))
+        return [tuple(row) if sort else row[0] for row in cur.fetchall()]
+
+    bounds = _page_bounds.get(key, load)
+    index = min(page - 2, len(bounds) - 1)
+    return bounds[index] if index >= 0 else None
+
+
+def _invalidate_page_bounds(*tables):
+    _page_bounds.invalidate_keys(lambda key: key[0] in tables)
+    if "books_search" in tables:
+        _search_cache.clear()
+
+
+# ===== ENTITY CACHE =====
+# Book rows, inventory summaries and title -> id lookups are read-through
+# cached. Writes made through this module invalidate the affected entries;
+# writes from anywhere else (another thread's or process's connection) show
+# up as a change of PRAGMA data_version on the reading connection, which
+# drops everything.
+_book_cache = LRUCache(4096)
+_summary_cache = LRUCache(4096)
+_title_cache = LRUCache(4096)
+# Ranked (score, id) lists of recent book searches, see _search_ranking;
+# bounded by the matches they hold (16 bytes each), not by their number
+_SEARCH_CACHE_MATCHES = 500_000
+_search_cache = LRUCache(_SEARCH_CACHE_MATCHES, sizeof=lambda ranking: len(ranking[1]) if ranking else 1)
+_CACHES = {"books": _book_cache, "summaries": _summary_cache, "titles": _title_cache, "searches": _search_cache,
+           "pages": _page_bounds}
+_cache_local = threading.local()
+
+
+def _check_data_version():
+    conn = get_connection()
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    seen = getattr(_cache_local, "seen", None)
+    # data_version values are only comparable on the same connection, so a
+    # connection we haven't seen before can't vouch for the cache either
+    if seen is None or seen[0] is not conn or seen[1] != version:
+        if seen is not None or any(c.stats()["size"] for c in _CACHES.values()):
+            clear_caches()
+        _cache_local.seen = (conn, version)
+
+
+def _forget_book(book_id):
+    _book_cache.invalidate(book_id)
+    _summary_cache.invalidate(book_id)
+    _title_cache.invalidate_values(book_id)
+
+
+def clear_caches():
+    for c in _CACHES.values():
+        c.clear()
+
+
+def cache_stats():
+    """Hit/miss counters and sizes of the entity caches, by cache name."""
+    return {name: c.stats() for name, c in _CACHES.items()}
+
+
+# ===== BOOK FILTERS =====
+# Structured filters for the book list and search. The filter indexes
+# (migration 6) lead with the equality columns and end with pub_date, so a
+# combination like language + genre + status + a date range is one index
+# range per IN value.
+FILTER_FIELDS = FACETS + ["pub_from", "pub_to", "has_translator"]
+
+
+def _book_filter(filters, alias="books"):
+    """Turn a filters dict into a (where, params) pair for books.
+
+    genre/language/status take a value or a list of values (a book matches
+    any of them; "" stands for NULL). pub_from/pub_to bound pub_date
+    inclusively and also accept a bare year. has_translator is True or
+    False. None or empty entries don't filter.
+    """
+    filters = {k: v for k, v in (filters or {}).items() if v not in (None, "", [], ())}
+    unknown = set(filters) - set(FILTER_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown filter(s): {', '.join(sorted(unknown))}")
+    clauses, params = [], []
+    for facet in FACETS:
+        if facet not in filters:
+            continue
+        values = [filters[facet]] if isinstance(filters[facet], str) else list(filters[facet])
+        clause = f"{alias}.{facet} IN ({', '.join('?' * len(values))})"
+        if "" in values:
+            clause = f"({clause} OR {alias}.{facet} IS NULL)"
+        clauses.append(clause)
+        params += values
+    if "pub_from" in filters:
+        pub_from = str(filters["pub_from"])
+        clauses.append(f"{alias}.pub_date >= ?")
+        params.append(f"{pub_from}-01-01" if len(pub_from) == 4 else pub_from)
+    if "pub_to" in filters:
+        pub_to = str(filters["pub_to"])
+        clauses.append(f"{alias}.pub_date <= ?")
+        params.append(f"{pub_to}-12-31" if len(pub_to) == 4 else pub_to)
+    if "has_translator" in filters:
+        # Written exactly as idx_books_has_translator's expression
+        clauses.append(f"(IFNULL({alias}.translator, '') != '') = ?")
+        params.append(1 if filters["has_translator"] else 0)
+    return " AND ".join(clauses), tuple(params)
+
+
+def _filter_key(filters):
+    """A hashable form of `filters` for the page index cache."""
+    return tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in (filters or {}).items()
+                        if v not in (None, "", [], ())))
 
 
 # ===== BOOK FUNCTIONS =====
+_BOOK_COLUMNS = "id, book_number, title, author, translator, pub_date, isbn, language, genre, edition, status"
+
+
+def _prefixed_book_columns(alias):
+    return ", ".join(f"{alias}.{col.strip()}" for col in _BOOK_COLUMNS.split(","))
+
+
+def _claim_isbn(cur, data, book_id=None):
+    """The isbn13 value to store for `data` (a new book, or book `book_id`).
+
+    Raises ValueError for an invalid ISBN, or one another book already has.
+    A book keeps an ISBN it already had even when it shares it with copies
+    entered before ISBNs were checked; find_duplicate_isbns() lists those.
+    """
+    if not data["isbn"]:
+        return None
+    key = normalize_isbn(data["isbn"])
+    if key is None:
+        raise ValueError(f"Invalid ISBN: {data['isbn']}")
+    if book_id is not None:
+        old = cur.execute("SELECT isbn FROM books WHERE id = ?", (book_id,)).fetchone()
+        if old and old[0] and normalize_isbn(old[0]) == key:
+            return key
+    other = cur.execute("SELECT book_number FROM books WHERE isbn13 = ? AND id IS NOT ? LIMIT 1",
+                        (key, book_id)).fetchone()
+    if other:
+        raise ValueError(f"ISBN {data['isbn']} already belongs to book number {other[0]}")
+    return key
+
+
+@retry_on_busy
 def insert_book(data):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('''
-                INSERT INTO books (book_number, title, author, translator, pub_date,
-                                   isbn, language, genre, edition, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', tuple(data.values()))
-    book_id = cur.lastrowid
-    cur.execute("INSERT INTO inventory (book_id) VALUES (?)", (book_id,))
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        cur = conn.cursor()
+        begin_immediate(cur)
+        isbn13 = _claim_isbn(cur, data)
+        cur.execute('''
+                    INSERT INTO books (book_number, title, author, translator, pub_date,
+                                       isbn, language, genre, edition, status, isbn13)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', tuple(data.values()) + (isbn13,))
+        book_id = cur.lastrowid
+        cur.execute("INSERT INTO inventory (book_id) VALUES (?)", (book_id,))
+        # In the same transaction, which already holds the write lock
+        _index_search_terms(1)
+    _invalidate_page_bounds("books", "books_search", "books_filter", "books_sort")
+    _title_cache.invalidate(data["title"])
+
+
+_BULK_INSERT_THRESHOLD = 1000
+_BULK_SUSPENDED_TRIGGERS = ["books_fts_ai", "books_count_ai", "books_facets_ai", "books_terms_ai"]
+
+
+def _trigger_sql(name):
+    return next(sql for sql in _FTS_TRIGGERS + _COUNT_TRIGGERS + _FACET_TRIGGERS + _TERM_TRIGGERS
+                if f" EXISTS {name} " in sql)
+
+
+def _existing_values(cur, column, values, chunk=500, table="books"):
+    found = set()
+    values = list(values)
+    for i in range(0, len(values), chunk):
+        part = values[i:i + chunk]
+        cur.execute(f"SELECT {column} FROM {table} WHERE {column} IN ({', '.join('?' * len(part))})", part)
+        found.update(row[0] for row in cur.fetchall())
+    return found
+
+
+@retry_on_busy
+def insert_books_batch(books):
+    """Insert many books and their inventory rows in a single transaction.
+
+    `books` is a list of (data, inventory) pairs: data is shaped like the
+    argument of insert_book, inventory is a dict with any of available,
+    lent, missing and damaged. Books whose number or title is already taken
+    (in the database or earlier in the batch) are skipped, and so are
+    books with an invalid or already used ISBN. Returns a list of (index,
+    message) for the skipped entries.
+    """
+    conn = get_connection()
+    skipped = []
+    with conn:
+        cur = conn.cursor()
+        # Take the write lock up front so the duplicate checks below stay valid
+        begin_immediate(cur)
+        taken_numbers = _existing_values(cur, "book_number", {d["book_number"] for d, _ in books})
+        taken_titles = _existing_values(cur, "title", {d["title"] for d, _ in books})
+        isbn_keys = [normalize_isbn(d["isbn"]) if d["isbn"] else None for d, _ in books]
+        taken_isbns = _existing_values(cur, "isbn13", set(isbn_keys) - {None})
+
+        book_rows = []
+        inventory_rows = []
+        for index, (data, inventory) in enumerate(books):
+            if data["book_number"] in taken_numbers:
+                skipped.append((index, f"Book number {data['book_number']} already exists"))
+                continue
+            if data["title"] in taken_titles:
+                skipped.append((index, f"Title '{data['title']}' already exists"))
+                continue
+            isbn13 = isbn_keys[index]
+            if data["isbn"] and isbn13 is None:
+                skipped.append((index, f"Invalid ISBN: {data['isbn']}"))
+                continue
+            if isbn13 in taken_isbns:
+                skipped.append((index, f"ISBN {data['isbn']} already exists"))
+                continue
+            taken_numbers.add(data["book_number"])
+            taken_titles.add(data["title"])
+            if isbn13:
+                taken_isbns.add(isbn13)
+            book_rows.append(tuple(data.values()) + (isbn13,))
+            inventory_rows.append((
+                inventory.get("available", 0),
+                inventory.get("lent", 0),
+                inventory.get("missing", 0),
+                inventory.get("damaged", 0),
+                data["book_number"],
+            ))
+
+        # Per-row triggers dominate large loads: suspend them for this
+        # transaction and apply their effect once afterwards. DDL is
+        # transactional, so other connections never see them missing.
+        bulk = len(book_rows) >= _BULK_INSERT_THRESHOLD and _has_search_index()
+        if bulk:
+            first_id = cur.execute("SELECT IFNULL(MAX(id), 0) FROM books").fetchone()[0]
+            for name in _BULK_SUSPENDED_TRIGGERS:
+                cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+        cur.executemany('''
+                        INSERT INTO books (book_number, title, author, translator, pub_date,
+                                           isbn, language, genre, edition, status, isbn13)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ''', book_rows)
+
+        if bulk:
+            cur.execute('''
+                        INSERT INTO books_fts (rowid, title, author, translator, isbn)
+                        SELECT id, title, author, translator, isbn
+                        FROM books
+                        WHERE id > ?
+                        ''', (first_id,))
+            cur.execute("UPDATE row_counts SET count = count + ? WHERE table_name = 'books'", (len(book_rows),))
+            _add_facet_counts(cur, "id > ?", (first_id,))
+            cur.execute("INSERT INTO search_terms_pending (book_id) SELECT id FROM books WHERE id > ?", (first_id,))
+            for name in _BULK_SUSPENDED_TRIGGERS:
+                cur.execute(_trigger_sql(name))
+        cur.executemany('''
+                        INSERT INTO inventory (book_id, available, lent, missing, damaged)
+                        SELECT id, ?, ?, ?, ?
+                        FROM books
+                        WHERE book_number = ?
+                        ''', inventory_rows)
+        _index_search_terms(len(book_rows))
+    _invalidate_page_bounds("books", "books_search", "books_filter", "books_sort")
+    _title_cache.clear()
+    return skipped
+
+
+def _load_book(book_id):
+    return get_connection().execute(f"SELECT {_BOOK_COLUMNS} FROM books WHERE id = ?", (book_id,)).fetchone()
+
+
+def _load_title(title):
+    row = get_connection().execute("SELECT id FROM books WHERE title = ?", (title,)).fetchone()
+    return row[0] if row else None
+
+
+def get_book(book_id):
+    _check_data_version()
+    # The cache holds plain tuples; every caller gets its own Book
+    row = _book_cache.get(book_id, lambda: _load_book(book_id))
+    return Book(*row) if row else None
 
 
 def find_book_by_title(title):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM books WHERE title = ?", (title,))
-    result = cur.fetchone()
-    conn.close()
-    return result
+    _check_data_version()
+    book_id = _title_cache.get(title, lambda: _load_title(title))
+    if book_id is None:
+        return None
+    row = _book_cache.get(book_id, lambda: _load_book(book_id))
+    return Book(*row) if row else None
+
+
+def find_books_by_isbn(isbn):
+    """Every copy with this ISBN, written as ISBN-10 or -13 with or without hyphens, by id."""
+    key = normalize_isbn(isbn)
+    if key is None:
+        return []
+    rows = get_connection().execute("SELECT id FROM books WHERE isbn13 = ? ORDER BY id", (key,)).fetchall()
+    return [get_book(book_id) for book_id, in rows]
+
+
+def find_duplicate_isbns():
+    """Books that share an ISBN however it was written, and books with an invalid one.
+
+    One pass over the catalog, grouping by normalised ISBN in a dict; the
+    stored isbn13 is used where there is one, so only unkeyed ISBNs are
+    normalised here. Returns {"duplicates": [(isbn13, [(id, book_number, title, isbn), ...]), ...],
+    "invalid": [(id, book_number, title, isbn), ...]}, ordered by id.
+    """
+    conn = get_connection()
+    groups = {}
+    invalid = []
+    for book_id, isbn, isbn13 in conn.execute("SELECT id, isbn, isbn13 FROM books WHERE isbn != ''"):
+        key = isbn13 or normalize_isbn(isbn)
+        if key is None:
+            invalid.append(book_id)
+        else:
+            groups.setdefault(key, []).append(book_id)
+    duplicates = {key: ids for key, ids in groups.items() if len(ids) > 1}
+    wanted = invalid + [book_id for ids in duplicates.values() for book_id in ids]
+    details = {}
+    for i in range(0, len(wanted), 500):
+        part = wanted[i:i + 500]
+        details.update((row[0], row) for row in conn.execute(
+            f"SELECT id, book_number, title, isbn FROM books WHERE id IN ({', '.join('?' * len(part))})", part))
+    return {
+        "duplicates": sorted(((key, [details[i] for i in sorted(ids)]) for key, ids in duplicates.items()),
+                             key=lambda group: group[1][0][0]),
+        "invalid": [details[i] for i in sorted(invalid)],
+    }
 
 
-def get_books_paginated(page: int, page_size: int = 100):
+def get_books_paginated(page: int, page_size: int = 100, sort=None):
     offset = (page - 1) * page_size
-    conn = sqlite3.connect(DB_NAME)
+    order = "id"
+    if sort:
+        _, expr, desc = _sort_column("books", sort)
+        order = f"{expr} DESC, id DESC" if desc else f"{expr}, id"
+    conn = get_connection()
     cur = conn.cursor()
-    cur.execute("""
+    cur.execute(f"""
                 SELECT id,
                        book_number,
                        title,
@@ -103,262 +937,872 @@ def get_books_paginated(page: int, page_size: int = 100):
                        edition,
                        status
                 FROM books
-                ORDER BY id
+                ORDER BY {order}
                 LIMIT ? OFFSET ?
                 """, (page_size, offset))
+    cur.row_factory = book_factory
     rows = cur.fetchall()
-    conn.close()
     return rows
 
 
+def get_books_after(after_id=None, page_size=100, filters=None, sort=None):
+    where, params = _book_filter(filters)
+    return _keyset_page("books", _BOOK_COLUMNS, after_id=after_id, page_size=page_size, row_factory=book_factory,
+                        where=where, params=params, sort=sort)
+
+
+def get_books_before(before_id, page_size=100, filters=None, sort=None):
+    where, params = _book_filter(filters)
+    return _keyset_page("books", _BOOK_COLUMNS, before_id=before_id, page_size=page_size,
+                        row_factory=book_factory, where=where, params=params, sort=sort)
+
+
+def get_books_page_cursor(page, page_size=100, filters=None, sort=None):
+    where, params = _book_filter(filters)
+    if not where:
+        return _page_cursor("books", page, page_size, sort=sort)
+    return _page_cursor("books", page, page_size, where, params,
+                        key=("books_filter", page_size, _filter_key(filters), sort), sort=sort)
+
+
 # ... (keep all your existing book functions, just change DB_NAME to "library.db")
 
-def get_total_books_count():
-    conn = sqlite3.connect(DB_NAME)
+def _cached_count(table):
+    conn = get_connection()
     cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM books")
-    total = cur.fetchone()[0]
-    conn.close()
-    return total
+    cur.execute("SELECT count FROM row_counts WHERE table_name = ?", (table,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
 
+def get_total_books_count(filters=None):
+    where, params = _book_filter(filters)
+    if not where:
+        return _cached_count("books")
+    # Counted from the filter indexes, without touching the table rows
+    return get_connection().execute(f"SELECT COUNT(*) FROM books WHERE {where}", params).fetchone()[0]
 
+
+@retry_on_busy
 def update_book(book_id, data):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    values = list(data.values())
-    values.append(book_id)
-    cur.execute('''
-                UPDATE books
-                SET book_number=?,
-                    title=?,
-                    author=?,
-                    translator=?,
-                    pub_date=?,
-                    isbn=?,
-                    language=?,
-                    genre=?,
-                    edition=?,
-                    status=?
-                WHERE id = ?
-                ''', values)
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        cur = conn.cursor()
+        begin_immediate(cur)
+        isbn13 = _claim_isbn(cur, data, book_id)
+        values = list(data.values())
+        values += [isbn13, book_id]
+        cur.execute('''
+                    UPDATE books
+                    SET book_number=?,
+                        title=?,
+                        author=?,
+                        translator=?,
+                        pub_date=?,
+                        isbn=?,
+                        language=?,
+                        genre=?,
+                        edition=?,
+                        status=?,
+                        isbn13=?
+                    WHERE id = ?
+                    ''', values)
+        _index_search_terms(1)
+    _invalidate_page_bounds("books_search", "books_filter", "books_sort")
+    _forget_book(book_id)
+    _title_cache.invalidate(data["title"])
 
 
+@retry_on_busy
 def delete_book(book_id):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM books WHERE id=?", (book_id,))
-    cur.execute("DELETE FROM inventory WHERE book_id=?", (book_id,))
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM books WHERE id=?", (book_id,))
+        cur.execute("DELETE FROM inventory WHERE book_id=?", (book_id,))
+    _invalidate_page_bounds("books", "books_search", "books_filter", "books_sort")
+    _forget_book(book_id)
 
 
-def search_books(term, exact=False):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
+def rebuild_search_index():
+    """Repopulate books_fts from the books table (e.g. after a bulk load)."""
+    conn = get_connection()
+    with conn:
+        conn.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+
+
+def _has_search_index():
+    conn = get_connection()
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'").fetchone()
+    return row is not None
+
+
+def _fts_query(term):
+    # Every word must match as a prefix, quoted so user input can't inject
+    # FTS operators: 'tolk lord' -> '"tolk"* "lord"*'
+    words = re.findall(r"\w+", term)
+    return " ".join(f'"{w}"*' for w in words)
+
+
+# ===== FUZZY SEARCH =====
+# Typos are matched word by word against the distinct title and author
+# words: a trigram index over those words shortlists the ones of about the
+# same length sharing the most trigrams, difflib's ratio (which copes with
+# swapped letters, unlike trigrams) ranks the shortlist, and books containing
+# one of the closest words match through books_fts. Triggers queue every
+# new or edited book in search_terms_pending; only words not seen before
+# get postings, so keeping up costs next to nothing. Searches only read the
+# word list: each book write indexes as many queued books as it wrote, and
+# build_pending_indexes() works off any backlog, so a search never waits
+# on a write lock.
+FUZZY_MIN_SIMILARITY = 0.7
+FUZZY_TERMS_PER_WORD = 5
+FUZZY_SHORTLIST = 200
+_SEARCH_TERMS_CHUNK = 10_000
 
+
+def _trigrams(word):
+    """A word's trigrams, padded so its start and end count: 'ann' -> '  a', ' an', 'ann', 'nn '."""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _words(text):
+    """The words of `text` as the FTS tokenizer sees them: lower case, no diacritics."""
+    folded = "".join(ch for ch in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(ch))
+    return re.findall(r"[^\W_]+", folded)
+
+
+@retry_on_busy
+def _index_search_terms(limit=None):
+    """Index the words of the queued books, one transaction per chunk.
+
+    With `limit`, at most that many books are taken off the queue.
+    """
+    conn = get_connection()
+    while limit is None or limit > 0:
+        with conn:
+            cur = conn.cursor()
+            begin_immediate(cur)
+            cur.execute("""
+                        SELECT p.book_id, b.title, b.author
+                        FROM search_terms_pending p
+                                 LEFT JOIN books b ON b.id = p.book_id
+                        ORDER BY p.book_id
+                        LIMIT ?
+                        """, (min(limit or _SEARCH_TERMS_CHUNK, _SEARCH_TERMS_CHUNK),))
+            rows = cur.fetchall()
+            if not rows:
+                return
+            words = {word for _, title, author in rows for word in _words(f"{title or ''} {author or ''}")}
+            known = _existing_values(cur, "term", words, table="search_terms")
+            new = [(word, _trigrams(word)) for word in sorted(words - known)]
+            cur.executemany("INSERT INTO search_terms (term, grams) VALUES (?, ?)",
+                            [(word, len(grams)) for word, grams in new])
+            # In key order, which roughly halves the insert time
+            cur.executemany("INSERT INTO search_grams (gram, term) VALUES (?, ?)",
+                            sorted((gram, word) for word, grams in new for gram in grams))
+            cur.execute("DELETE FROM search_terms_pending WHERE book_id <= ?", (rows[-1][0],))
+        if limit is not None:
+            limit -= len(rows)
+
+
+def _fuzzy_terms(word):
+    """The indexed words most like `word`, as (term, similarity) pairs, best first."""
+    grams = _trigrams(word)
+    shortlist = get_connection().execute(f"""
+        SELECT s.term
+        FROM (SELECT term, COUNT(*) AS shared FROM search_grams
+              WHERE gram IN ({", ".join("?" * len(grams))}) GROUP BY term) s
+                 JOIN search_terms t ON t.term = s.term
+        WHERE t.grams BETWEEN ? AND ?
+        ORDER BY s.shared * 1.0 / (? + t.grams - s.shared) DESC
+        LIMIT ?
+        """, (*grams, len(grams) - 2, len(grams) + 2, len(grams), FUZZY_SHORTLIST)).fetchall()
+    scored = sorted(((SequenceMatcher(None, word, term).ratio(), term) for term, in shortlist), reverse=True)
+    return [(term, ratio) for ratio, term in scored[:FUZZY_TERMS_PER_WORD] if ratio >= FUZZY_MIN_SIMILARITY]
+
+
+def _fuzzy_search_hits(term):
+    """Like _book_search_hits, for a typo-tolerant search.
+
+    A book matches when its title or author has a word close to each query
+    word; its score is minus the summed similarities. Query words nothing
+    resembles are ignored. Books still queued for indexing only match
+    through words other books already have.
+    """
+    parts, params, words = [], [], 0
+    for word in dict.fromkeys(_words(term)):
+        candidates = _fuzzy_terms(word)
+        for candidate, similarity in candidates:
+            parts.append(f"SELECT rowid AS id, {words} AS word, ? AS similarity FROM books_fts "
+                         f"WHERE books_fts MATCH ?")
+            params += [similarity, f'{{title author}} : "{candidate}"']
+        words += bool(candidates)
+    if not parts:
+        return None
+    return f"""
+           SELECT id, -SUM(similarity) AS score
+           FROM (SELECT id, word, MAX(similarity) AS similarity FROM ({" UNION ALL ".join(parts)}) GROUP BY id, word)
+           GROUP BY id
+           HAVING COUNT(*) = {words}
+           """, tuple(params)
+
+
+def _book_search_hits(term, exact=False, fuzzy=False):
+    """Build a query yielding (id, score) for every book matching `term`.
+
+    Lower scores rank first. Returns None when the term can't match
+    anything (e.g. only punctuation).
+    """
+    term = term.strip()
+    isbn13 = normalize_isbn(term)
+    if isbn13:
+        # Looks like an ISBN: one lookup in idx_books_isbn13 (plus the
+        # book number, which a 10 or 13 digit term could also be)
+        parts, params = ["SELECT id, -1e300 AS score FROM books WHERE isbn13 = ?"], [isbn13]
+        if term.isdigit():
+            parts.append("SELECT id, -1e300 AS score FROM books WHERE book_number = ?")
+            params.append(int(term))
+        return " UNION ALL ".join(parts), tuple(params)
+    if fuzzy and _has_search_index():
+        return _fuzzy_search_hits(term)
     if exact:
-        term_lower = term.strip().lower()
-        query = """
-                SELECT *
-                FROM books
-                WHERE CAST(book_number AS TEXT) = ?
-                   OR LOWER(title) = ?
-                   OR LOWER(author) = ?
-                """
-        c.execute(query, (term_lower, term_lower, term_lower))
+        # One indexed lookup per column; the NOCASE comparisons match
+        # idx_books_title_nocase / idx_books_author_nocase
+        parts = ["SELECT id, 0 AS score FROM books WHERE title = ? COLLATE NOCASE",
+                 "SELECT id, 0 AS score FROM books WHERE author = ? COLLATE NOCASE"]
+        params = [term, term]
+        if term.isdigit():
+            parts.append("SELECT id, 0 AS score FROM books WHERE book_number = ?")
+            params.append(int(term))
+        return " UNION ALL ".join(parts), tuple(params)
+
+    if not _has_search_index():
+        term_like = f"%{term.lower()}%"
+        return """
+               SELECT id, 0 AS score
+               FROM books
+               WHERE LOWER(CAST(book_number AS TEXT)) LIKE ?
+                  OR LOWER(title) LIKE ?
+                  OR LOWER(author) LIKE ?
+               """, (term_like, term_like, term_like)
+
+    parts, params = [], []
+    match = _fts_query(term)
+    if match:
+        # bm25 weights: title > author > translator > isbn
+        parts.append("SELECT rowid AS id, bm25(books_fts, 10.0, 5.0, 2.0, 1.0) AS score "
+                     "FROM books_fts WHERE books_fts MATCH ?")
+        params.append(match)
+    if term.isdigit():
+        # A book number hit always ranks above text matches
+        parts.append("SELECT id, -1e300 AS score FROM books WHERE book_number = ?")
+        params.append(int(term))
+    if not parts:
+        return None
+    return " UNION ALL ".join(parts), tuple(params)
+
+
+def _ranked_search(term, exact, filters=None, fuzzy=False):
+    hits = _book_search_hits(term, exact, fuzzy)
+    if hits is None:
+        return None
+    sql, params = hits
+    where, filter_params = _book_filter(filters, "b")
+    if where:
+        ranked = (f"SELECT h.id, MIN(h.score) AS score FROM hits h JOIN books b ON b.id = h.id "
+                  f"WHERE {where} GROUP BY h.id")
     else:
-        term_like = f"%{term.strip().lower()}%"
-        query = """
-                SELECT *
-                FROM books
-                WHERE LOWER(CAST(book_number AS TEXT)) LIKE ?
-                   OR LOWER(title) LIKE ?
-                   OR LOWER(author) LIKE ?
-                """
-        c.execute(query, (term_like, term_like, term_like))
+        ranked = "SELECT id, MIN(score) AS score FROM hits GROUP BY id"
+    # MATERIALIZED: bm25() only works when the FTS query isn't flattened
+    return f"WITH hits AS MATERIALIZED ({sql}), ranked AS ({ranked})", params + filter_params
 
-    results = c.fetchall()
-    conn.close()
-    return results
 
+def search_books(term, exact=False, filters=None, fuzzy=False):
+    """Every book matching `term` (and `filters`), best match first, as a BookColumns.
 
-def export_books():
-    import pandas as pd
-    conn = sqlite3.connect(DB_NAME)
-    df = pd.read_sql_query("""
-                           SELECT b.*, i.available, i.lent, i.missing, i.damaged
-                           FROM books b
-                                    LEFT JOIN inventory i ON b.id = i.book_id
-                           """, conn)
-    df.to_excel("books_export.xlsx", index=False)
-    conn.close()
+    With `fuzzy`, misspelt title and author words still match.
+    """
+    ranked = _ranked_search(term, exact, filters, fuzzy)
+    if ranked is None:
+        return BookColumns()
+    cte, params = ranked
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(f"""
+              {cte}
+              SELECT {_prefixed_book_columns("b")}
+              FROM ranked r
+                       JOIN books b ON b.id = r.id
+              ORDER BY r.score, r.id
+              """, params)
+    return BookColumns(c)
 
 
-def get_copy_summary(book_id):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("SELECT available, lent, missing, damaged FROM inventory WHERE book_id = ?", (book_id,))
-    row = cur.fetchone()
-    conn.close()
-    if row:
-        available, lent, missing, damaged = row
-        return {
-            "Available": available,
-            "Lent": lent,
-            "Missing": missing,
-            "Damaged": damaged,
-            "total": available + lent + missing + damaged
-        }
+_RANKING_CHUNK = 5000
+_FACET_CHUNK = 10_000
+
+
+def _search_ranking(term, exact=False, filters=None, fuzzy=False):
+    """(scores, ids) of every match, best first, or None if nothing can match.
+
+    Ranking a broad term costs about as much as ranking all its matches, so
+    the ranking is done once per search and kept in _search_cache (as two
+    compact arrays); paging through it then costs a page, not a search.
+    The rows are read into the arrays a chunk at a time, so a broad term
+    never holds more than one chunk as Python tuples.
+    """
+    _check_data_version()
+    key = (term.strip(), exact, _filter_key(filters), fuzzy)
+
+    def load():
+        ranked = _ranked_search(term, exact, filters, fuzzy)
+        if ranked is None:
+            return None
+        cte, params = ranked
+        cur = get_connection().execute(f"{cte} SELECT score, id FROM ranked ORDER BY score, id", params)
+        scores, ids = array("d"), array("q")
+        while rows := cur.fetchmany(_RANKING_CHUNK):
+            for score, book_id in rows:
+                scores.append(score)
+                ids.append(book_id)
+        return scores, ids
+
+    return _search_cache.get(key, load)
+
+
+def search_books_page(term, exact=False, cursor=None, page_size=100, before=False, filters=None, fuzzy=False):
+    """Fetch one page of search results in relevance order.
+
+    `cursor` is a (score, id) key taken from a previous page: results after
+    it are returned, or the page before it when `before` is true. Returns
+    (rows, (first_key, last_key)); the keys are the cursors for the
+    previous and next page. `filters` narrows the results like
+    get_books_after's; `fuzzy` is as for search_books.
+    """
+    ranking = _search_ranking(term, exact, filters, fuzzy)
+    if ranking is None:
+        return [], (None, None)
+    scores, ids = ranking
+    start, end = 0, min(page_size, len(ids))
+    if cursor is not None:
+        def sort_key(i):
+            return scores[i], ids[i]
+        if before:
+            end = bisect_left(range(len(ids)), tuple(cursor), key=sort_key)
+            start = max(0, end - page_size)
+        else:
+            start = bisect_right(range(len(ids)), tuple(cursor), key=sort_key)
+            end = min(start + page_size, len(ids))
+    page_ids = ids[start:end].tolist()
+    if not page_ids:
+        return [], (None, None)
+    conn = get_connection()
+    found = {row[0]: row for row in conn.execute(
+        f"SELECT {_BOOK_COLUMNS} FROM books WHERE id IN ({', '.join('?' * len(page_ids))})", page_ids)}
+    keys = ((scores[start], ids[start]), (scores[end - 1], ids[end - 1]))
+    return [Book(*found[book_id]) for book_id in page_ids if book_id in found], keys
+
+
+def search_books_page_cursor(term, exact=False, page=1, page_size=100, filters=None, fuzzy=False):
+    """Return the cursor that starts `page` of a search, or None for page 1."""
+    if page <= 1:
+        return None
+    ranking = _search_ranking(term, exact, filters, fuzzy)
+    if ranking is None:
+        return None
+    scores, ids = ranking
+    # The key of the last row of page - 1, or of the last full page
+    index = min(page - 1, len(ids) // page_size) * page_size - 1
+    return (scores[index], ids[index]) if index >= 0 else None
+
+
+def count_search_results(term, exact=False, limit=None, filters=None, fuzzy=False):
+    """Count the books matching a search without fetching them.
+
+    The count is the length of the search's ranking, which its pages share.
+    With `limit` it is capped there, so a result equal to `limit` means "at
+    least this many".
+    """
+    ranking = _search_ranking(term, exact, filters, fuzzy)
+    count = len(ranking[1]) if ranking else 0
+    return count if limit is None else min(count, limit)
+
+
+def get_facet_counts(term=None, exact=False, filters=None, fuzzy=False):
+    """Book counts per genre, language and status value, most common first.
+
+    Returns {facet: [(value, count), ...]} with NULL reported as "".
+    Without a term or filters this is a read of book_facets, whose size
+    depends on the number of distinct values, not on the catalog. With a
+    term only the books matching the search are counted, and each facet is
+    counted under every filter except its own, so the other values of a
+    filtered facet stay visible.
+    """
+    counts = {facet: [] for facet in FACETS}
+    conn = get_connection()
+    if not term and not _book_filter(filters)[0]:
+        rows = conn.execute("SELECT facet, value, count FROM book_facets WHERE count > 0").fetchall()
+    elif not term:
+        parts, params = [], ()
+        for facet in FACETS:
+            where, filter_params = _book_filter({k: v for k, v in filters.items() if k != facet})
+            if not where:
+                # Only this facet is filtered: its own counts are the stored ones
+                parts.append(f"SELECT facet, value, count FROM book_facets WHERE facet = '{facet}' AND count > 0")
+                continue
+            parts.append(f"SELECT '{facet}', IFNULL({facet}, ''), COUNT(*) FROM books WHERE {where} GROUP BY 2")
+            params += filter_params
+        rows = conn.execute(" UNION ALL ".join(parts), params).fetchall()
     else:
-        return {"Available": 0, "Lent": 0, "Missing": 0, "Damaged": 0, "total": 0}
+        # Counted over the ranking of the term alone (usually already made
+        # for its first page), a chunk of ids at a time. Each book is read
+        # once: its facet values and, per facet, whether it passes the other
+        # filters, grouped so only the distinct combinations come back.
+        ranking = _search_ranking(term, exact, None, fuzzy)
+        if ranking is None:
+            return counts
+        ids = ranking[1]
+        passes, params = [], ()
+        for facet in FACETS:
+            where, filter_params = _book_filter({k: v for k, v in (filters or {}).items() if k != facet})
+            passes.append(f"({where or 'true'})")
+            params += filter_params
+        values = ", ".join(f"IFNULL({facet}, '')" for facet in FACETS)
+        group = ", ".join(str(i + 1) for i in range(2 * len(FACETS)))
+        totals = {}
+        for i in range(0, len(ids), _FACET_CHUNK):
+            chunk = ids[i:i + _FACET_CHUNK].tolist()
+            for row in conn.execute(f"SELECT {values}, {', '.join(passes)}, COUNT(*) FROM books "
+                                    f"WHERE id IN ({', '.join('?' * len(chunk))}) GROUP BY {group}",
+                                    params + tuple(chunk)):
+                for j, facet in enumerate(FACETS):
+                    if row[len(FACETS) + j]:
+                        totals[facet, row[j]] = totals.get((facet, row[j]), 0) + row[-1]
+        rows = [(facet, value, count) for (facet, value), count in totals.items()]
+    for facet, value, count in sorted(rows, key=lambda row: (-row[2], row[1])):
+        counts[facet].append((value, count))
+    return counts
 
 
-def update_inventory(book_id, **kwargs):
-    conn = sqlite3.connect(DB_NAME)
+EXPORT_COLUMNS = ["id", "book_number", "title", "author", "translator", "pub_date", "isbn", "language", "genre",
+                  "edition", "status", "available", "lent", "missing", "damaged"]
+
+
+def iter_books_for_export(chunk_size=5000):
+    """Yield every book joined with its inventory counts, `chunk_size` rows at a time.
+
+    Rows follow EXPORT_COLUMNS. The chunks come from a single statement, so
+    the export is a consistent snapshot even if the catalog changes meanwhile.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(f"""
+                SELECT {_prefixed_book_columns("b")}, i.available, i.lent, i.missing, i.damaged
+                FROM books b
+                         LEFT JOIN inventory i ON b.id = i.book_id
+                ORDER BY b.id
+                """)
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+def get_export_rows_after(after_id=None, page_size=1000):
+    """One page of iter_books_for_export's rows, after book `after_id`.
+
+    For exporting over server.py, where a generator can't be sent; unlike
+    iter_books_for_export the pages aren't one snapshot.
+    """
+    conn = get_connection()
     cur = conn.cursor()
-    cur.execute("SELECT 1 FROM inventory WHERE book_id = ?", (book_id,))
-    exists = cur.fetchone()
+    cur.execute(f"""
+                SELECT {_prefixed_book_columns("b")}, i.available, i.lent, i.missing, i.damaged
+                FROM books b
+                         LEFT JOIN inventory i ON b.id = i.book_id
+                WHERE b.id > ?
+                ORDER BY b.id
+                LIMIT ?
+                """, (after_id or 0, page_size))
+    return cur.fetchall()
+
+
+def _load_inventory(book_id):
+    conn = get_connection()
+    row = conn.execute("SELECT available, lent, missing, damaged FROM inventory WHERE book_id = ?",
+                       (book_id,)).fetchone()
+    return row or (0, 0, 0, 0)
+
+
+def get_inventory(book_id):
+    _check_data_version()
+    return Inventory(book_id, *_summary_cache.get(book_id, lambda: _load_inventory(book_id)))
+
+
+def get_copy_summary(book_id):
+    inventory = get_inventory(book_id)
+    return {
+        "Available": inventory.available,
+        "Lent": inventory.lent,
+        "Missing": inventory.missing,
+        "Damaged": inventory.damaged,
+        "total": inventory.total
+    }
+
+
+INVENTORY_FIELDS = ["available", "lent", "missing", "damaged"]
+
+
+def _inventory_values(fields):
+    unknown = set(fields) - set(INVENTORY_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown inventory field(s): {', '.join(sorted(unknown))}")
+    return [fields.get(k, 0) for k in INVENTORY_FIELDS]
+
+
+@retry_on_busy
+def update_inventory(book_id, **kwargs):
+    """Overwrite the given counts (creating the inventory row if needed)."""
+    values = _inventory_values(kwargs)
+    if not kwargs:
+        return
+    sets = ", ".join(f"{k} = excluded.{k}" for k in INVENTORY_FIELDS if k in kwargs)
+    conn = get_connection()
+    with conn:
+        conn.execute(f"""
+                     INSERT INTO inventory (book_id, available, lent, missing, damaged)
+                     VALUES (?, ?, ?, ?, ?)
+                     ON CONFLICT (book_id) DO UPDATE SET {sets}
+                     """, [book_id] + values)
+    _summary_cache.invalidate(book_id)
+
+
+# Counts move by a delta inside one UPDATE, so concurrent adjustments add
+# up instead of overwriting each other. The upsert only makes sure the row
+# exists: SQLite checks CHECK constraints on the would-be inserted row
+# before resolving the conflict, so the (possibly negative) deltas can't be
+# passed through excluded.*.
+_ENSURE_INVENTORY_SQL = "INSERT INTO inventory (book_id) VALUES (?) ON CONFLICT (book_id) DO NOTHING"
+_ADJUST_INVENTORY_SQL = f"""
+    UPDATE inventory
+    SET {", ".join(f"{k} = {k} + ?" for k in INVENTORY_FIELDS)}
+    WHERE book_id = ?
+    """
 
-    if not exists:
-        cur.execute(
-            "INSERT INTO inventory (book_id, available, lent, missing, damaged) VALUES (?, 0, 0, 0, 0)",
-            (book_id,)
-        )
 
-    sets = []
-    values = []
-    for field in ["available", "lent", "missing", "damaged"]:
-        if field in kwargs:
-            sets.append(f"{field} = ?")
-            values.append(kwargs[field])
+def adjust_inventory(book_id, **deltas):
+    """Add deltas to a book's counts, e.g. adjust_inventory(7, available=-1, lent=+1).
 
-    if sets:
-        values.append(book_id)
-        cur.execute(f"UPDATE inventory SET {', '.join(sets)} WHERE book_id = ?", values)
+    Raises sqlite3.IntegrityError (and changes nothing) if a count would
+    drop below zero.
+    """
+    adjust_inventory_batch([(book_id, deltas)])
 
-    conn.commit()
-    conn.close()
+
+@retry_on_busy
+def adjust_inventory_batch(adjustments):
+    """Apply many (book_id, {field: delta}) adjustments in one transaction.
+
+    All or nothing: if any count would go negative the whole batch is
+    rolled back with sqlite3.IntegrityError.
+    """
+    rows = [_inventory_values(deltas) + [book_id] for book_id, deltas in adjustments]
+    conn = get_connection()
+    with conn:
+        conn.executemany(_ENSURE_INVENTORY_SQL, [(row[-1],) for row in rows])
+        conn.executemany(_ADJUST_INVENTORY_SQL, rows)
+    _summary_cache.invalidate(*(row[-1] for row in rows))
 
 
 # ===== USER FUNCTIONS =====
+_USER_COLUMNS = "id, name, email, phone, membership_type, status"
+
+
+@retry_on_busy
 def insert_user(data):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('''
-                INSERT INTO users (name, email, phone, membership_type, status)
-                VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    data['name'],
-                    data['email'],
-                    data['phone'],
-                    data['membership_type'],
-                    data['status']
-                ))
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        cur = conn.cursor()
+        cur.execute('''
+                    INSERT INTO users (name, email, phone, membership_type, status)
+                    VALUES (?, ?, ?, ?, ?)
+                    ''', (
+                        data['name'],
+                        data['email'],
+                        data['phone'],
+                        data['membership_type'],
+                        data['status']
+                    ))
+    _invalidate_page_bounds("users", "users_search", "users_sort")
 
 
+@retry_on_busy
 def update_user(user_id, data):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('''
-                UPDATE users
-                SET name            = ?,
-                    email           = ?,
-                    phone           = ?,
-                    membership_type = ?,
-                    status          = ?
-                WHERE id = ?
-                ''', (
-                    data['name'],
-                    data['email'],
-                    data['phone'],
-                    data['membership_type'],
-                    data['status'],
-                    user_id
-                ))
-    conn.commit()
-    conn.close()
-
-
-def get_users_paginated(page, page_size):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
+    with conn:
+        cur = conn.cursor()
+        cur.execute('''
+                    UPDATE users
+                    SET name            = ?,
+                        email           = ?,
+                        phone           = ?,
+                        membership_type = ?,
+                        status          = ?
+                    WHERE id = ?
+                    ''', (
+                        data['name'],
+                        data['email'],
+                        data['phone'],
+                        data['membership_type'],
+                        data['status'],
+                        user_id
+                    ))
+    _invalidate_page_bounds("users_search", "users_sort")
+
+
+def get_users_paginated(page, page_size, sort=None):
+    order = "id"
+    if sort:
+        _, expr, desc = _sort_column("users", sort)
+        order = f"{expr} DESC, id DESC" if desc else f"{expr}, id"
+    conn = get_connection()
     cur = conn.cursor()
     offset = (page - 1) * page_size
-    cur.execute('''
-                SELECT *
+    cur.execute(f'''
+                SELECT id, name, email, phone, membership_type, status
                 FROM users
-                ORDER BY id
+                ORDER BY {order}
                 LIMIT ? OFFSET ?
                 ''', (page_size, offset))
+    cur.row_factory = user_factory
     users = cur.fetchall()
-    conn.close()
     return users
 
 
+def get_users_after(after_id=None, page_size=100, sort=None):
+    return _keyset_page("users", _USER_COLUMNS, after_id=after_id, page_size=page_size, row_factory=user_factory,
+                        sort=sort)
+
+
+def get_users_before(before_id, page_size=100, sort=None):
+    return _keyset_page("users", _USER_COLUMNS, before_id=before_id, page_size=page_size,
+                        row_factory=user_factory, sort=sort)
+
+
+def get_users_page_cursor(page, page_size=100, sort=None):
+    return _page_cursor("users", page, page_size, sort=sort)
+
+
 def get_total_users_count():
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM users")
-    count = cur.fetchone()[0]
-    conn.close()
-    return count
+    return _cached_count("users")
+
+
+def _user_search_filter(term, exact=False):
+    if exact:
+        return "name = ? COLLATE NOCASE OR email = ? COLLATE NOCASE OR phone = ?", (term, term, term)
+    return "name LIKE ? OR email LIKE ? OR phone LIKE ?", (f"%{term}%", f"%{term}%", f"%{term}%")
 
 
 def search_users(term, exact=False):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cur = conn.cursor()
+    where, params = _user_search_filter(term, exact)
+    cur.execute(f"SELECT {_USER_COLUMNS} FROM users WHERE {where} ORDER BY id", params)
+    cur.row_factory = user_factory
+    users = cur.fetchall()
+    return users
 
-    if exact:
-        query = '''
-                SELECT *
-                FROM users
-                WHERE name = ?
-                   OR email = ?
-                   OR phone = ? \
-                '''
-        params = (term, term, term)
+
+def search_users_page(term, exact=False, cursor=None, page_size=100, before=False):
+    """Fetch one page of user search results, keyed by id like get_users_after."""
+    where, params = _user_search_filter(term, exact)
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.row_factory = user_factory
+    if cursor is None:
+        cur.execute(f"SELECT {_USER_COLUMNS} FROM users WHERE ({where}) ORDER BY id LIMIT ?", params + (page_size,))
+    elif before:
+        cur.execute(f"""
+                    SELECT * FROM (SELECT {_USER_COLUMNS} FROM users
+                                   WHERE ({where}) AND id < ? ORDER BY id DESC LIMIT ?)
+                    ORDER BY id
+                    """, params + (cursor, page_size))
     else:
-        query = '''
-                SELECT *
-                FROM users
-                WHERE name LIKE ?
-                   OR email LIKE ?
-                   OR phone LIKE ? \
-                '''
-        params = (f"%{term}%", f"%{term}%", f"%{term}%")
+        cur.execute(f"SELECT {_USER_COLUMNS} FROM users WHERE ({where}) AND id > ? ORDER BY id LIMIT ?",
+                    params + (cursor, page_size))
+    return cur.fetchall()
 
-    cur.execute(query, params)
-    users = cur.fetchall()
-    conn.close()
-    return users
+
+def search_users_page_cursor(term, exact=False, page=1, page_size=100):
+    if page <= 1:
+        return None
+    _check_data_version()
+    key = ("users_search", page_size, term, exact)
+
+    def load():
+        where, params = _user_search_filter(term, exact)
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute(f"""
+                    SELECT id FROM (SELECT id, ROW_NUMBER() OVER (ORDER BY id) AS rn FROM users WHERE {where})
+                    WHERE rn % ? = 0
+                    ORDER BY id
+                    """, params + (page_size,))
+        return [row[0] for row in cur.fetchall()]
+
+    bounds = _page_bounds.get(key, load)
+    index = min(page - 2, len(bounds) - 1)
+    return bounds[index] if index >= 0 else None
+
+
+def count_search_users(term, exact=False, limit=None):
+    where, params = _user_search_filter(term, exact)
+    conn = get_connection()
+    cur = conn.cursor()
+    if limit is None:
+        cur.execute(f"SELECT COUNT(*) FROM users WHERE {where}", params)
+    else:
+        cur.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM users WHERE {where} LIMIT ?)", params + (limit,))
+    return cur.fetchone()[0]
 
 
 # ... (keep all other existing functions, updating DB_NAME to "library.db")
 
 # db.py (add these functions)
-def create_user_tables():
-    # Create users table
-    conn = sqlite3.connect('library.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (
-                     id              INTEGER PRIMARY KEY AUTOINCREMENT,
-                     name            TEXT NOT NULL,
-                     email           TEXT NOT NULL UNIQUE,
-                     phone           TEXT,
-                     membership_type TEXT,
-                     status          TEXT
-                 )''')
-    conn.commit()
-    conn.close()
+@retry_on_busy
+def delete_user(user_id):
+    conn = get_connection()
+    with conn:
+        c = conn.cursor()
+        c.execute('DELETE FROM users WHERE id = ?', (user_id,))
+    _invalidate_page_bounds("users", "users_search", "users_sort")
 
 
-def delete_user(user_id):
-    conn = sqlite3.connect('library.db')
-    c = conn.cursor()
-    c.execute('DELETE FROM users WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+# ===== LOAN FUNCTIONS =====
+# A loan moves one copy from inventory.available to inventory.lent and back;
+# the loan row and the counts always change in the same transaction.
+LOAN_DAYS = 14
+_LOAN_COLUMNS = "l.id, l.book_id, b.title, l.user_id, u.name, l.loan_date, l.due_date, l.return_date"
+
+
+@retry_on_busy
+def checkout(book_id, user_id, days=LOAN_DAYS, loan_date=None):
+    """Lend one copy of a book to a user; returns the new loan id.
+
+    Raises ValueError if the user isn't active or no copy is available.
+    """
+    loan_date = loan_date or date.today()
+    conn = get_connection()
+    with conn:
+        cur = conn.cursor()
+        begin_immediate(cur)
+        user = cur.execute("SELECT status FROM users WHERE id = ?", (user_id,)).fetchone()
+        if user is None:
+            raise ValueError(f"User {user_id} doesn't exist")
+        if user[0] != "Active":
+            raise ValueError(f"User {user_id} is {user[0]}")
+        cur.execute("UPDATE inventory SET available = available - 1, lent = lent + 1 "
+                    "WHERE book_id = ? AND available > 0", (book_id,))
+        if cur.rowcount == 0:
+            raise ValueError("No copies of this book are available")
+        cur.execute("INSERT INTO loans (book_id, user_id, loan_date, due_date) VALUES (?, ?, ?, ?)",
+                    (book_id, user_id, loan_date.isoformat(), (loan_date + timedelta(days=days)).isoformat()))
+        loan_id = cur.lastrowid
+    _summary_cache.invalidate(book_id)
+    return loan_id
+
+
+@retry_on_busy
+def checkin(loan_id, return_date=None):
+    """Mark a loan returned and put the copy back on the shelf.
+
+    Raises ValueError if the loan doesn't exist or was already returned, or
+    if the book's inventory has no lent copy to put back.
+    """
+    return_date = return_date or date.today()
+    conn = get_connection()
+    with conn:
+        cur = conn.cursor()
+        begin_immediate(cur)
+        cur.execute("UPDATE loans SET return_date = ? WHERE id = ? AND return_date IS NULL",
+                    (return_date.isoformat(), loan_id))
+        if cur.rowcount == 0:
+            raise ValueError(f"Loan {loan_id} isn't open")
+        book_id = cur.execute("SELECT book_id FROM loans WHERE id = ?", (loan_id,)).fetchone()[0]
+        cur.execute('''
+                    UPDATE inventory
+                    SET available = available + 1,
+                        lent      = lent - 1
+                    WHERE book_id = ?
+                      AND lent > 0
+                    ''', (book_id,))
+        if cur.rowcount == 0:
+            raise ValueError(f"Book {book_id} has no lent copy to return")
+    _summary_cache.invalidate(book_id)
+
+
+def get_overdue_loans(as_of=None, after=None, page_size=100):
+    """Open loans whose due date has passed, oldest due first.
+
+    `after` is the (due_date, id) of the last loan on the previous page.
+    Served from the partial idx_loans_open_due index.
+    """
+    as_of = (as_of or date.today()).isoformat()
+    where, params = "", (as_of,)
+    if after is not None:
+        where, params = "AND (l.due_date, l.id) > (?, ?)", params + tuple(after)
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(f"""
+                SELECT {_LOAN_COLUMNS}
+                FROM loans l
+                         JOIN books b ON b.id = l.book_id
+                         JOIN users u ON u.id = l.user_id
+                WHERE l.return_date IS NULL
+                  AND l.due_date < ? {where}
+                ORDER BY l.due_date, l.id
+                LIMIT ?
+                """, params + (page_size,))
+    return cur.fetchall()
+
+
+def _loans_for(column, value, open_only, page_size):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(f"""
+                SELECT {_LOAN_COLUMNS}
+                FROM loans l
+                         JOIN books b ON b.id = l.book_id
+                         JOIN users u ON u.id = l.user_id
+                WHERE l.{column} = ? {"AND l.return_date IS NULL" if open_only else ""}
+                ORDER BY l.id DESC
+                LIMIT ?
+                """, (value, page_size))
+    return cur.fetchall()
+
+
+def get_user_loans(user_id, open_only=False, page_size=100):
+    """A user's loans, newest first."""
+    return _loans_for("user_id", user_id, open_only, page_size)
+
+
+def get_book_loans(book_id, open_only=False, page_size=100):
+    """A book's loans, newest first."""
+    return _loans_for("book_id", book_id, open_only, page_size)
+
+
+# ===== INSTRUMENTATION =====
+# Time every public function above; clear_caches/cache_stats never touch SQLite
+instrument_module(globals(), skip={"clear_caches", "cache_stats"})
+
+
+if __name__ == "__main__":
+    import sys
+
+    create_tables()
+    if sys.argv[1:] == ["rebuild-search-index"]:
+        rebuild_search_index()
+        print("✅ Search index rebuilt.")
@@ -0,0 +1,56 @@
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DbExecutor:
+    """Runs data-layer calls on worker threads so UI handlers never wait on SQLite.
+
+    Calls submitted with a `key` (e.g. "books.page") supersede earlier calls
+    with the same key: when an older call finishes after a newer one was
+    submitted, its result is dropped instead of overwriting the newer one.
+    Calls without a key (writes) always report back.
+    """
+
+    def __init__(self, max_workers=4):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._latest = {}
+
+    def submit(self, fn, *args, key=None, on_done=None, on_error=None, **kwargs):
+        """Run fn(*args, **kwargs) in the background; returns its generation token.
+
+        on_done(result) / on_error(exception) run on the worker thread, and
+        only if no newer call with the same key has been submitted since.
+        """
+        with self._lock:
+            generation = next(self._counter)
+            if key is not None:
+                self._latest[key] = generation
+
+        def run():
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as ex:
+                if on_error and self.is_current(key, generation):
+                    on_error(ex)
+            else:
+                if on_done and self.is_current(key, generation):
+                    on_done(result)
+
+        self._pool.submit(run)
+        return generation
+
+    def is_current(self, key, generation):
+        if key is None:
+            return True
+        with self._lock:
+            return self._latest.get(key) == generation
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Shared by the Flet tabs
+db_executor = DbExecutor()
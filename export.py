@@ -1,13 +1,136 @@
-import pandas as pd
+import csv
+import os
+import threading
 from datetime import datetime
 
+from backend import EXPORT_COLUMNS, SERVER, get_export_rows_after, get_total_books_count
+from connection import close_connection
+from db import iter_books_for_export
+from rpc import MAX_PAGE_SIZE
+
+BOOK_HEADERS = ["ID", "Book Number", "Title", "Author", "Translator", "Publication Date", "ISBN", "Language", "Genre",
+                "Edition", "Status"]
+EXPORT_HEADERS = BOOK_HEADERS + ["Available", "Lent", "Missing", "Damaged"]
+
+_INT_COLUMNS = {"id", "book_number", "available", "lent", "missing", "damaged"}
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def _write_csv(path, headers, chunks):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        for rows in chunks:
+            writer.writerows(rows)
+
+
+def _write_xlsx(path, headers, chunks):
+    # Write-only workbooks stream rows to disk instead of keeping every cell
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Books")
+    ws.append(headers)
+    for rows in chunks:
+        for row in rows:
+            ws.append(row)
+    wb.save(path)
+
+
+def _write_parquet(path, headers, chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(h, pa.int64() if c in _INT_COLUMNS else pa.string())
+                        for h, c in zip(headers, EXPORT_COLUMNS)])
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_batch(pa.record_batch([pa.array(col, type=field.type)
+                                                for col, field in zip(columns, schema)], schema=schema))
+
+
+WRITERS = {
+    "csv": _write_csv,
+    "xlsx": _write_xlsx,
+    "parquet": _write_parquet,
+}
+
+
+def _chunks(chunk_size):
+    """The export rows, chunk by chunk.
+
+    Locally they come from one statement, a consistent snapshot; a server
+    is paged through by book id instead.
+    """
+    if not SERVER:
+        yield from iter_books_for_export(chunk_size)
+        return
+    after_id = None
+    while rows := get_export_rows_after(after_id, min(chunk_size, MAX_PAGE_SIZE)):
+        yield rows
+        after_id = rows[-1][0]
+
+
+def export_books(path, fmt=None, chunk_size=5000, progress=None, cancel=None):
+    """Stream the catalog (with inventory counts) to a CSV, XLSX or Parquet file.
+
+    Memory stays bounded by `chunk_size` whatever the catalog size. The
+    format defaults to the file extension. `progress(done, total)` is called
+    after every chunk; setting the `cancel` event stops the export, removes
+    the partial file and raises ExportCancelled. Returns the row count.
+    """
+    fmt = (fmt or os.path.splitext(path)[1].lstrip(".")).lower()
+    if fmt not in WRITERS:
+        raise ValueError(f"Unsupported export format '{fmt}' (expected {', '.join(WRITERS)})")
+    total = get_total_books_count()
+    written = 0
+
+    def tracked():
+        nonlocal written
+        for rows in _chunks(chunk_size):
+            if cancel is not None and cancel.is_set():
+                raise ExportCancelled()
+            yield rows
+            written += len(rows)
+            if progress:
+                progress(written, total)
+
+    try:
+        WRITERS[fmt](path, EXPORT_HEADERS, tracked())
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return written
+
+
+def start_export(path, fmt=None, progress=None, on_done=None, on_error=None):
+    """Run export_books on a background thread; returns an Event that cancels it.
+
+    on_done(path, rows) or on_error(exception) is called from that thread
+    when it finishes.
+    """
+    cancel = threading.Event()
+
+    def run():
+        try:
+            rows = export_books(path, fmt, progress=progress, cancel=cancel)
+        except Exception as ex:
+            if on_error:
+                on_error(ex)
+        else:
+            if on_done:
+                on_done(path, rows)
+        finally:
+            close_connection()
+
+    threading.Thread(target=run, name="export", daemon=True).start()
+    return cancel
+
+
 def export_books_to_excel(book_rows):
-    columns = [
-        "ID", "Title", "Author", "Translator", "Publisher",
-        "Publication Date", "ISBN", "Language", "Genre",
-        "Pages", "Edition", "Status"
-    ]
-    df = pd.DataFrame(book_rows, columns=columns)
     filename = f"book_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    df.to_excel(filename, index=False)
+    _write_xlsx(filename, BOOK_HEADERS, [book_rows])
     return filename
@@ -0,0 +1,115 @@
+import csv
+import json
+import os
+
+from backend import INVENTORY_FIELDS, insert_books_batch
+from validation import parse_book
+
+def _normalise_header(name):
+    # "Book Number" / "book-number" -> "book_number"
+    return str(name or "").strip().lower().replace(" ", "_").replace("-", "_")
+
+
+def _read_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = [_normalise_header(h) for h in next(reader, [])]
+        for row in reader:
+            yield dict(zip(header, row))
+
+
+def _read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield {_normalise_header(k): v for k, v in json.loads(line).items()}
+
+
+def _read_xlsx(path):
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = [_normalise_header(h) for h in next(rows, [])]
+        for row in rows:
+            yield dict(zip(header, row))
+    finally:
+        wb.close()
+
+
+READERS = {
+    ".csv": _read_csv,
+    ".jsonl": _read_jsonl,
+    ".xlsx": _read_xlsx,
+}
+
+
+def read_rows(path):
+    """Stream rows from a CSV, JSONL or XLSX file as dicts keyed by column name."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in READERS:
+        raise ValueError(f"Unsupported file type '{ext}' (expected {', '.join(READERS)})")
+    return READERS[ext](path)
+
+
+def _parse_inventory(row):
+    inventory = {}
+    for k in INVENTORY_FIELDS:
+        val = row.get(k)
+        if val is None or str(val).strip() == "":
+            continue
+        try:
+            count = int(float(val))
+        except (ValueError, OverflowError):
+            raise ValueError(f"{k} must be a number")
+        if count < 0:
+            raise ValueError(f"{k} can't be negative")
+        inventory[k] = count
+    return inventory
+
+
+def import_books(path, batch_size=50000, progress=None):
+    """Bulk-load books (and inventory counts) from a CSV, JSONL or XLSX file.
+
+    Rows are validated like the book form and written with
+    insert_books_batch, one transaction per `batch_size` rows.
+    `progress(processed, inserted, failed)` is called after every batch.
+
+    Returns {"processed", "inserted", "errors"} where errors is a list of
+    (line number, message); line 1 is the header for CSV/XLSX files.
+    """
+    report = {"processed": 0, "inserted": 0, "errors": []}
+    first_line = 1 if path.lower().endswith(".jsonl") else 2
+    batch = []
+    lines = []
+
+    def flush():
+        skipped = insert_books_batch(batch) if batch else []
+        for index, message in skipped:
+            report["errors"].append((lines[index], message))
+        report["inserted"] += len(batch) - len(skipped)
+        batch.clear()
+        lines.clear()
+        if progress:
+            progress(report["processed"], report["inserted"], len(report["errors"]))
+
+    for line, row in enumerate(read_rows(path), start=first_line):
+        report["processed"] += 1
+        data, errors = parse_book(row)
+        if errors:
+            report["errors"].append((line, f"Missing or invalid: {', '.join(errors)}"))
+            continue
+        data["status"] = data["status"] or "Available"
+        try:
+            inventory = _parse_inventory(row)
+        except ValueError as ex:
+            report["errors"].append((line, str(ex)))
+            continue
+        batch.append((data, inventory))
+        lines.append(line)
+        if len(batch) >= batch_size:
+            flush()
+
+    flush()
+    return report
@@ -0,0 +1,220 @@
+import bisect
+import functools
+import logging
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+from connection import get_connection
+
+# Calls slower than this are written to the slow-query log
+SLOW_QUERY_MS = 100
+SLOW_QUERY_LOG = "slow_queries.log"
+SLOW_QUERY_LOG_BYTES = 1_000_000
+SLOW_QUERY_LOG_BACKUPS = 3
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Statements kept per call for EXPLAIN QUERY PLAN; bulk inserts run thousands
+MAX_STATEMENTS = 20
+MAX_ARGS_CHARS = 200
+
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_enabled = True
+_local = threading.local()
+_lock = threading.Lock()
+_stats = {}
+_logger = logging.getLogger("bookmanager.slow_queries")
+_logger.propagate = False
+
+
+class CallStats:
+    """Latency histogram and totals for one data-layer function."""
+
+    __slots__ = ("calls", "errors", "rows", "total_ms", "max_ms", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, ms, rows, failed):
+        self.calls += 1
+        self.errors += failed
+        self.rows += rows
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.buckets[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+
+    def percentile(self, p):
+        """Upper bound (ms) of the bucket holding the p-th percentile call."""
+        if not self.calls:
+            return 0.0
+        wanted = p / 100 * self.calls
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "mean_ms": self.total_ms / self.calls if self.calls else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "max_ms": self.max_ms,
+            "buckets": list(self.buckets),
+        }
+
+
+def configure(enabled=None, threshold_ms=None, log_path=None):
+    """Change the instrumentation settings; a new log_path takes effect on the next slow call."""
+    global _enabled, SLOW_QUERY_MS, SLOW_QUERY_LOG
+    if enabled is not None:
+        _enabled = enabled
+    if threshold_ms is not None:
+        SLOW_QUERY_MS = threshold_ms
+    if log_path is not None:
+        SLOW_QUERY_LOG = log_path
+        for handler in list(_logger.handlers):
+            _logger.removeHandler(handler)
+            handler.close()
+
+
+def stats():
+    """Per-function latency stats, slowest mean first."""
+    with _lock:
+        snapshot = {name: s.as_dict() for name, s in _stats.items()}
+    return dict(sorted(snapshot.items(), key=lambda item: -item[1]["mean_ms"]))
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+def _trace(sql):
+    frames = getattr(_local, "frames", None)
+    if not frames:
+        return
+    if not sql.startswith("EXPLAIN"):
+        for statements in frames:
+            if len(statements) < MAX_STATEMENTS:
+                statements.append(sql)
+    if all(len(statements) >= MAX_STATEMENTS for statements in frames):
+        # Every open call has all it keeps; stop paying for the callback
+        # (executemany traces each row) until the next outermost call
+        _local.conn.set_trace_callback(None)
+        _local.tracing = False
+
+
+def _row_count(result):
+    if result is None or isinstance(result, (bool, int, str)):
+        return 0
+    # Paged searches return (rows, keys)
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        result = result[0]
+    try:
+        return len(result)
+    except TypeError:
+        return 1
+
+
+def _format_args(args, kwargs):
+    text = ", ".join([repr(a) for a in args] + [f"{k}={v!r}" for k, v in kwargs.items()])
+    return text if len(text) <= MAX_ARGS_CHARS else text[:MAX_ARGS_CHARS] + "..."
+
+
+def _explain(conn, sql):
+    try:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    except Exception as ex:
+        return [f"(no plan: {ex})"]
+    return [detail for _, _, _, detail in rows]
+
+
+def _log_slow(conn, name, ms, args, kwargs, rows, changed, statements):
+    if not _logger.handlers:
+        handler = RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_BYTES,
+                                      backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+    lines = [f"{name}({_format_args(args, kwargs)}) took {ms:.1f} ms, {rows} rows, {changed} changed"]
+    for sql in statements:
+        if sql.lstrip().upper().startswith(_EXPLAINABLE):
+            lines.append(f"  {' '.join(sql.split())}")
+            lines.extend(f"    {detail}" for detail in _explain(conn, sql))
+    _logger.info("\n".join(lines))
+
+
+def instrumented(fn, name=None):
+    """Wrap a data-layer function so every call is timed and counted.
+
+    Calls over SLOW_QUERY_MS are logged with their arguments and the plan
+    of each statement they ran (as captured by the connection's trace
+    callback, with parameters already bound).
+    """
+    name = name or fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return fn(*args, **kwargs)
+        conn = get_connection()
+        if getattr(_local, "conn", None) is not conn:
+            _local.conn = conn
+            _local.frames = []
+            _local.tracing = False
+        if not _local.tracing:
+            conn.set_trace_callback(_trace)
+            _local.tracing = True
+        statements = []
+        _local.frames.append(statements)
+        changes = conn.total_changes
+        failed = False
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+            return result
+        except BaseException:
+            failed = True
+            result = None
+            raise
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            _local.frames.pop()
+            rows = _row_count(result)
+            with _lock:
+                call_stats = _stats.get(name)
+                if call_stats is None:
+                    call_stats = _stats[name] = CallStats()
+                call_stats.add(ms, rows, failed)
+            if ms >= SLOW_QUERY_MS:
+                _log_slow(conn, name, ms, args, kwargs, rows, conn.total_changes - changes, statements)
+
+    wrapper.uninstrumented = fn
+    return wrapper
+
+
+def instrument_module(namespace, skip=()):
+    """Replace every public function defined in a module with an instrumented wrapper.
+
+    Called with the module's globals() at the end of the module, so the
+    module's own calls and later `from module import name` imports both
+    get the wrapped versions.
+    """
+    module = namespace["__name__"]
+    for name, value in list(namespace.items()):
+        if (callable(value) and not name.startswith("_") and name not in skip
+                and getattr(value, "__module__", None) == module and not isinstance(value, type)):
+            namespace[name] = instrumented(value, name)
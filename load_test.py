@@ -0,0 +1,153 @@
+"""Load-test server.py on localhost with many concurrent clients.
+
+    python load_test.py --clients 16 --seconds 10
+
+Builds a temporary catalog (benchmark.build_database), starts server.py
+on a free port in a subprocess and runs a mix of UI-shaped calls from
+--clients threads: page browsing as one batched round trip, searches,
+inventory lookups and adjustments, checkouts and checkins. Prints
+throughput and per-operation latency percentiles as JSON.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import benchmark
+import connection
+from rpc import RemoteBackend
+
+
+def _percentile(sorted_ms, p):
+    return sorted_ms[min(len(sorted_ms) - 1, int(len(sorted_ms) * p / 100))] if sorted_ms else 0.0
+
+
+def _operations(remote, books, users):
+    def browse():
+        after = random.randrange(books)
+        remote.batch([("get_books_after", [after], {"page_size": 100}),
+                      ("get_total_books_count", [], {}),
+                      ("get_books_page_cursor", [after // 100 + 1], {"page_size": 100})])
+
+    def search():
+        remote.search_books_page(f"vol {random.randrange(books)}", page_size=100)
+
+    def search_users():
+        remote.search_users_page(f"{random.randrange(users)}", page_size=100)
+
+    def inventory():
+        remote.get_inventory(random.randrange(1, books + 1))
+
+    def adjust():
+        book_id = random.randrange(1, books + 1)
+        remote.adjust_inventory(book_id, damaged=1)
+        remote.adjust_inventory(book_id, damaged=-1)
+
+    def lend():
+        try:
+            loan_id = remote.checkout(random.randrange(1, books + 1), random.randrange(1, users + 1))
+        except ValueError:
+            return  # nothing on the shelf or an inactive member
+        remote.checkin(loan_id)
+
+    # (name, operation, weight)
+    return [("browse", browse, 40), ("search", search, 20), ("search_users", search_users, 10),
+            ("inventory", inventory, 20), ("adjust", adjust, 5), ("lend", lend, 5)]
+
+
+def _client(address, books, users, deadline, results, errors):
+    remote = RemoteBackend(address)
+    operations = _operations(remote, books, users)
+    names, fns, weights = zip(*operations)
+    try:
+        while time.perf_counter() < deadline:
+            i = random.choices(range(len(fns)), weights)[0]
+            start = time.perf_counter()
+            try:
+                fns[i]()
+            except Exception as ex:
+                errors.append(f"{names[i]}: {ex}")
+                continue
+            results.append((names[i], (time.perf_counter() - start) * 1000))
+    finally:
+        remote.close()
+
+
+def _start_server(db_path, workers):
+    proc = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"),
+                             "--db", db_path, "--port", "0", "--workers", str(workers)],
+                            stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    if not line:
+        proc.wait()
+        raise RuntimeError("server.py exited before it started serving")
+    return proc, line.rsplit(" ", 1)[1].strip()
+
+
+def run(clients=8, seconds=10, books=20_000, users=2_000, workers=8):
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    db_path = os.path.join(workdir, "library.db")
+    benchmark.build_database(db_path, books, users)
+    connection.close_all_connections()
+
+    proc, address = _start_server(db_path, workers)
+    results, errors = [], []
+    try:
+        deadline = time.perf_counter() + seconds
+        threads = [threading.Thread(target=_client, args=(address, books, users, deadline, results, errors))
+                   for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    by_op = {}
+    for name, ms in results:
+        by_op.setdefault(name, []).append(ms)
+    report = {
+        "clients": clients,
+        "server_workers": workers,
+        "seconds": seconds,
+        "books": books,
+        "ops": len(results),
+        "ops_per_sec": len(results) / seconds,
+        "errors": len(errors),
+        "operations": {},
+    }
+    for name, samples in sorted(by_op.items()):
+        samples.sort()
+        report["operations"][name] = {
+            "count": len(samples),
+            "p50_ms": _percentile(samples, 50),
+            "p95_ms": _percentile(samples, 95),
+            "p99_ms": _percentile(samples, 99),
+        }
+    if errors:
+        report["first_errors"] = errors[:5]
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--books", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--workers", type=int, default=8, help="server worker threads / connections")
+    args = parser.parse_args(argv)
+
+    report = run(args.clients, args.seconds, args.books, args.users, args.workers)
+    print(json.dumps(report, indent=2))
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,34 @@
 import sys
 import os
+import atexit
+import threading
+import time
+
+_launched = time.perf_counter()
 
 # Add 'flet/' to sys.path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "flet"))
 sys.path.insert(0, os.path.dirname(__file__))
 
 import flet as ft
-from db import create_tables
+from connection import close_all_connections
+from executor import db_executor
+from write_queue import write_queue
+from backend import build_pending_indexes, cache_stats, has_pending_indexes, migrate
+from instrumentation import BUCKETS_MS, stats
 from books import create_books_tab
 from users import create_users_tab
 
+# Seconds from launch to the end of each startup phase, filled in by main()
+startup_timings = {}
+
+
+def mark_startup(phase):
+    startup_timings[phase] = time.perf_counter() - _launched
+
 
 def main(page: ft.Page):
+    mark_startup("imports")
     page.title = "Book Manager | Andaraz"
     page.window_width = 1500
     page.window_height = 1000
@@ -21,7 +38,20 @@ def main(page: ft.Page):
     page.bgcolor = ft.Colors.GREY_50
     page.padding = 0  # ❗️Removes outer whitespace
 
-    create_tables()
+    # Only touches the schema when user_version is behind; indexes added by
+    # a migration are built in the background once the window is up
+    migrate()
+    mark_startup("migrate")
+
+    # Stop background queries and release the long-lived SQLite connections
+    # when the session closes. Not on disconnect: the session may reconnect,
+    # and the executor and write queue can't be restarted once shut down.
+    def shutdown(e):
+        db_executor.shutdown()
+        write_queue.shutdown()
+        close_all_connections()
+
+    page.on_close = shutdown
 
     def show_snack_bar(message, color=ft.Colors.RED_300):
         snack_bar = ft.SnackBar(
@@ -32,16 +62,27 @@ def main(page: ft.Page):
         page.snack_bar = snack_bar
         page.open(snack_bar)
 
-    # Create tab content views
-    books_tab = create_books_tab(page, show_snack_bar)
-    users_tab = create_users_tab(page, show_snack_bar)
+    def on_first_page():
+        if "first_page" not in startup_timings:
+            mark_startup("first_page")
+
+    # Create tab content views; the users tab is only built the first time
+    # it's selected
+    books_tab = create_books_tab(page, show_snack_bar, on_page_loaded=on_first_page)
+    users_tab = None
+    users_placeholder = ft.Container(ft.ProgressRing(), alignment=ft.alignment.center, expand=True)
+    mark_startup("books_tab")
 
     # Handle tab change events
     def on_tab_change(e):
+        nonlocal users_tab
         selected_index = e.control.selected_index
         if selected_index == 0 and hasattr(books_tab, "refresh_books"):
             books_tab.refresh_books()
-        elif selected_index == 1 and hasattr(users_tab, "refresh_users"):
+        elif selected_index == 1:
+            if users_tab is None:
+                users_tab = create_users_tab(page, show_snack_bar)
+                tabs.tabs[1].content = users_tab
             users_tab.refresh_users()
 
     # Tabs widget with consistent style
@@ -82,7 +123,7 @@ def main(page: ft.Page):
                     padding=10,
                     margin=0 # Keep this margin=0 on the Container
                 ),
-                content=users_tab
+                content=users_placeholder
             )
         ],
         expand=True,
@@ -124,11 +165,79 @@ def main(page: ft.Page):
         page.dialog = dialog
         page.open(dialog)
 
+    # Hidden diagnostics view (Ctrl+Shift+D): per-function latency
+    # histograms from the instrumented data layer, refreshed every second
+    def histogram(buckets):
+        peak = max(buckets) or 1
+        return ft.Row([
+            ft.Container(width=8, height=max(1, 24 * count / peak), bgcolor=ft.Colors.BLUE_300,
+                         tooltip=f"{label}: {count}")
+            for label, count in zip([f"≤{b} ms" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]} ms"], buckets)
+        ], spacing=1, vertical_alignment=ft.CrossAxisAlignment.END)
+
+    def diagnostics_rows():
+        return [
+            ft.DataRow(cells=[
+                ft.DataCell(ft.Text(name)),
+                ft.DataCell(ft.Text(str(s["calls"]))),
+                ft.DataCell(ft.Text(f"{s['p50_ms']:.1f}")),
+                ft.DataCell(ft.Text(f"{s['p95_ms']:.1f}")),
+                ft.DataCell(ft.Text(f"{s['max_ms']:.1f}")),
+                ft.DataCell(ft.Text(str(s["rows"]))),
+                ft.DataCell(histogram(s["buckets"])),
+            ])
+            for name, s in stats().items()
+        ]
+
+    def diagnostics_summary():
+        startup = ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in startup_timings.items())
+        caches = ", ".join(f"{name} {c['hits']}/{c['hits'] + c['misses']} hits"
+                           for name, c in cache_stats().items())
+        return f"Startup: {startup}\nCaches: {caches}"
+
+    def show_diagnostics_dialog(e=None):
+        summary = ft.Text(diagnostics_summary(), size=12, color=ft.Colors.GREY_700)
+        table = ft.DataTable(
+            columns=[ft.DataColumn(ft.Text(label), numeric=label not in ("Function", "Latency"))
+                     for label in ["Function", "Calls", "p50 ms", "p95 ms", "Max ms", "Rows", "Latency"]],
+            rows=diagnostics_rows(),
+            column_spacing=16,
+            data_row_min_height=36,
+        )
+
+        def refresh_loop():
+            while dialog.open:
+                time.sleep(1)
+                summary.value = diagnostics_summary()
+                table.rows = diagnostics_rows()
+                page.update()
+
+        dialog = ft.AlertDialog(
+            title=ft.Text("Diagnostics", size=18, weight=ft.FontWeight.BOLD),
+            content=ft.Column([summary, table], scroll=ft.ScrollMode.AUTO, width=900, height=600),
+            actions=[ft.TextButton("Close", on_click=lambda e: page.close(dialog))],
+        )
+        page.open(dialog)
+        threading.Thread(target=refresh_loop, daemon=True).start()
+
+    def on_keyboard(e: ft.KeyboardEvent):
+        if e.ctrl and e.shift and e.key == "D":
+            show_diagnostics_dialog()
+
+    page.on_keyboard_event = on_keyboard
+
     page.add(tab_container)
+    mark_startup("window")
+
+    if has_pending_indexes():
+        db_executor.submit(build_pending_indexes,
+                           on_error=lambda ex: show_snack_bar(f"Index build failed: {ex}"))
 
-    # Trigger initial book load
+    # Trigger initial book load (runs on the db executor; the window is
+    # already interactive while it loads)
     if hasattr(books_tab, "refresh_books"):
         books_tab.refresh_books()
 
 
+atexit.register(close_all_connections)
 ft.app(target=main)
\ No newline at end of file
@@ -0,0 +1,154 @@
+import sys
+from array import array
+
+
+class Book:
+    __slots__ = ("id", "book_number", "title", "author", "translator", "pub_date", "isbn", "language", "genre",
+                 "edition", "status")
+
+    def __init__(self, id, book_number, title, author, translator, pub_date, isbn, language, genre, edition,
+                 status):
+        self.id = id
+        self.book_number = book_number
+        self.title = title
+        self.author = author
+        self.translator = translator
+        self.pub_date = pub_date
+        self.isbn = isbn
+        self.language = language
+        self.genre = genre
+        self.edition = edition
+        self.status = status
+
+    def astuple(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def to_data(self):
+        """The fields insert_book/update_book take (everything but id)."""
+        return {name: getattr(self, name) for name in self.__slots__[1:]}
+
+    def __eq__(self, other):
+        return isinstance(other, Book) and self.astuple() == other.astuple()
+
+    def __repr__(self):
+        return f"Book(id={self.id!r}, book_number={self.book_number!r}, title={self.title!r})"
+
+
+class User:
+    __slots__ = ("id", "name", "email", "phone", "membership_type", "status")
+
+    def __init__(self, id, name, email, phone, membership_type, status):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.phone = phone
+        self.membership_type = membership_type
+        self.status = status
+
+    def astuple(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def to_data(self):
+        return {name: getattr(self, name) for name in self.__slots__[1:]}
+
+    def __eq__(self, other):
+        return isinstance(other, User) and self.astuple() == other.astuple()
+
+    def __repr__(self):
+        return f"User(id={self.id!r}, name={self.name!r}, email={self.email!r})"
+
+
+class Inventory:
+    __slots__ = ("book_id", "available", "lent", "missing", "damaged")
+
+    def __init__(self, book_id, available=0, lent=0, missing=0, damaged=0):
+        self.book_id = book_id
+        self.available = available
+        self.lent = lent
+        self.missing = missing
+        self.damaged = damaged
+
+    @property
+    def total(self):
+        return self.available + self.lent + self.missing + self.damaged
+
+    def __repr__(self):
+        return (f"Inventory(book_id={self.book_id!r}, available={self.available!r}, lent={self.lent!r}, "
+                f"missing={self.missing!r}, damaged={self.damaged!r})")
+
+
+# sqlite3 row factories: the query must select the columns in __slots__ order
+def book_factory(cursor, row):
+    return Book(*row)
+
+
+def user_factory(cursor, row):
+    return User(*row)
+
+
+class BookColumns:
+    """A large list of books stored column by column.
+
+    Ids live in a packed array and the low-cardinality columns (language,
+    genre, edition, status) as small integer codes into a table of
+    distinct, interned strings, so 100k results cost a fraction of 100k
+    tuples. Indexing and iterating produce Book objects on demand.
+    """
+
+    _CODED = ("language", "genre", "edition", "status")
+
+    def __init__(self, rows=()):
+        self._ids = array("q")
+        self._plain = {name: [] for name in Book.__slots__[1:] if name not in self._CODED}
+        self._codes = {name: array("I") for name in self._CODED}
+        self._values = {name: [] for name in self._CODED}
+        self._lookup = {name: {} for name in self._CODED}
+        for row in rows:
+            self.append(row)
+
+    def _encode(self, name, value):
+        lookup = self._lookup[name]
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(self._values[name])
+            self._values[name].append(sys.intern(value) if isinstance(value, str) else value)
+        return code
+
+    def append(self, row):
+        """Add a row given as a Book or a tuple in Book.__slots__ order."""
+        if isinstance(row, Book):
+            row = row.astuple()
+        self._ids.append(row[0])
+        for name, value in zip(Book.__slots__[1:], row[1:]):
+            if name in self._codes:
+                self._codes[name].append(self._encode(name, value))
+            else:
+                self._plain[name].append(value)
+
+    def column(self, name):
+        """All values of one column, in row order."""
+        if name == "id":
+            return list(self._ids)
+        if name in self._codes:
+            values = self._values[name]
+            return [values[code] for code in self._codes[name]]
+        return list(self._plain[name])
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return Book(self._ids[index], *(
+            self._values[name][self._codes[name][index]] if name in self._codes else self._plain[name][index]
+            for name in Book.__slots__[1:]
+        ))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
@@ -0,0 +1,228 @@
+"""Check that the db.py queries on the UI's hot paths are served by indexes.
+
+    python query_plan.py [--books 20000] [--verbose]
+
+Every public db.py function is called against a generated catalog while a
+trace callback records the SQL it runs. Each statement is then passed
+through EXPLAIN QUERY PLAN, and any full table scan coming from a case
+that isn't in ALLOWED_SCANS is reported. The exit code is 1 if there are
+any.
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+import benchmark
+import connection
+import db
+import instrumentation
+
+# Cases that read a whole table by design, by exact case name: a variant
+# like "[filtered]" is only exempt if it is listed itself
+ALLOWED_SCANS = {
+    "get_books_paginated": "legacy OFFSET paging steps over every skipped row",
+    "get_users_paginated": "legacy OFFSET paging steps over every skipped row",
+    "get_books_page_cursor": "the sparse page index is built from one pass over the ids",
+    "get_books_page_cursor[filtered]": "a broad date range is read in id order rather than sorted from the index",
+    "get_books_page_cursor[sorted]": "the sparse page index is built from one pass over the sort column's index",
+    "get_users_page_cursor": "the sparse page index is built from one pass over the ids",
+    "get_users_page_cursor[sorted]": "the sparse page index is built from one pass over the sort column's index",
+    "search_users_page_cursor": "the sparse page index is built from one pass over the matches",
+    "iter_books_for_export": "exports every row",
+    "search_users[partial]": "substring LIKE can't use an index",
+    "search_users_page[partial]": "substring LIKE can't use an index",
+    "count_search_users[partial]": "substring LIKE can't use an index",
+    "get_facet_counts": "unfiltered, it reads book_facets, which has one row per distinct value",
+    "find_duplicate_isbns": "the duplicate report reads every ISBN once",
+}
+
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+_SCAN = re.compile(r"^SCAN (\S+)")
+_TABLE_REF = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_KEYWORDS = {"where", "join", "left", "inner", "cross", "on", "order", "group", "limit", "set", "values", "union",
+             "natural", "using", "indexed", "not", "select"}
+
+
+def _tables(conn):
+    rows = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table'").fetchall()
+    return {name for name, sql in rows if "VIRTUAL TABLE" not in (sql or "").upper()}
+
+
+def full_scans(conn, sql, tables):
+    """Return the EXPLAIN QUERY PLAN lines of `sql` that scan one of `tables`.
+
+    Scans of CTEs, subqueries and FTS tables are fine, and so is a scan in
+    rowid order that a LIMIT stops early (first keyset page).
+    """
+    details = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        aliases[table] = table
+        if alias and alias.lower() not in _KEYWORDS:
+            aliases[alias] = table
+    bounded = re.search(r"\bLIMIT\b", sql, re.IGNORECASE) and not any("TEMP B-TREE" in d for d in details)
+    scans = []
+    for detail in details:
+        m = _SCAN.match(detail)
+        if m and aliases.get(m.group(1)) in tables and not bounded:
+            scans.append(detail)
+    return scans
+
+
+def _cases(books):
+    sample = db.get_books_after(db.get_books_page_cursor(books // 200 or 1, 100), 1)[0]
+    data = sample.to_data()
+    user = db.get_users_after(None, 1)[0]
+    # The generated ISBNs all start with 978, so this one is free
+    scratch = {**data, "book_number": 10 ** 12, "title": "Query plan scratch book", "isbn": "9790000000001"}
+    scratch_user = {"name": "Plan User", "email": "plan@example.invalid", "phone": "", "membership_type": "Regular",
+                    "status": "Active"}
+
+    def insert_delete_book():
+        db.insert_book(scratch)
+        db.delete_book(db.find_book_by_title(scratch["title"]).id)
+
+    def insert_delete_user():
+        db.insert_user(scratch_user)
+        user_id = db.search_users(scratch_user["email"], exact=True)[0].id
+        db.update_user(user_id, scratch_user)
+        db.delete_user(user_id)
+
+    def batch_insert_delete():
+        db.insert_books_batch([(scratch, {"available": 1})])
+        db.delete_book(db.find_book_by_title(scratch["title"]).id)
+
+    conn = connection.get_connection()
+    lendable = conn.execute("SELECT book_id FROM inventory WHERE available > 0 LIMIT 1").fetchone()[0]
+    active_user = conn.execute("SELECT id FROM users WHERE status = 'Active' LIMIT 1").fetchone()[0]
+    word = sample.title.split()[0]
+    narrow = {"language": sample.language, "genre": sample.genre, "status": sample.status,
+              "pub_from": "1990", "pub_to": "2000"}
+    return [
+        ("get_books_after", lambda: (db.get_books_after(None), db.get_books_after(sample.id))),
+        ("get_books_before", lambda: db.get_books_before(sample.id)),
+        ("get_books_paginated", lambda: db.get_books_paginated(5)),
+        ("get_books_page_cursor", lambda: db.get_books_page_cursor(5)),
+        ("get_total_books_count", db.get_total_books_count),
+        ("get_books_after[filtered]", lambda: (db.get_books_after(None, filters=narrow),
+                                               db.get_books_after(sample.id, filters={"genre": sample.genre}))),
+        ("get_books_before[filtered]", lambda: db.get_books_before(sample.id, filters={"status": sample.status})),
+        ("get_books_page_cursor[filtered]", lambda: db.get_books_page_cursor(2, filters={"pub_from": "1990"})),
+        ("get_total_books_count[filtered]", lambda: db.get_total_books_count(narrow)),
+        ("get_books_after[has_translator]", lambda: db.get_books_after(sample.id, filters={"has_translator": True})),
+        ("get_books_page_cursor[has_translator]",
+         lambda: db.get_books_page_cursor(2, filters={"has_translator": False})),
+        ("get_total_books_count[has_translator]", lambda: (db.get_total_books_count({"has_translator": True}),
+                                                           db.get_total_books_count({"has_translator": False}))),
+        ("get_books_after[sorted]", lambda: [db.get_books_after((getattr(sample, s.lstrip("-")), sample.id), sort=s)
+                                             for s in ["title", "-author", "pub_date", "-book_number"]]),
+        ("get_books_before[sorted]", lambda: db.get_books_before((sample.author, sample.id), sort="author")),
+        ("get_books_page_cursor[sorted]", lambda: db.get_books_page_cursor(5, sort="-pub_date")),
+        ("find_book_by_title", lambda: (db.clear_caches(), db.find_book_by_title(sample.title))),
+        ("find_books_by_isbn", lambda: db.find_books_by_isbn(sample.isbn)),
+        ("find_duplicate_isbns", db.find_duplicate_isbns),
+        ("get_copy_summary", lambda: (db.clear_caches(), db.get_copy_summary(sample.id))),
+        ("get_book", lambda: (db.clear_caches(), db.get_book(sample.id))),
+        ("search_books[exact title]", lambda: db.search_books(sample.title.upper(), exact=True)),
+        ("search_books[exact number]", lambda: db.search_books(str(sample.book_number), exact=True)),
+        ("search_books[isbn]", lambda: db.search_books(sample.isbn)),
+        ("search_books[partial]", lambda: db.search_books(word)),
+        ("search_books_page[exact]", lambda: db.search_books_page(sample.author, exact=True)),
+        ("search_books_page[partial]", lambda: db.search_books_page(word)),
+        ("search_books_page_cursor[partial]", lambda: db.search_books_page_cursor(word, page=2)),
+        ("search_books_page[fuzzy]", lambda: db.search_books_page(f"{sample.author[::-1]} {word}", fuzzy=True)),
+        ("count_search_results[fuzzy]", lambda: db.count_search_results(word, fuzzy=True)),
+        ("count_search_results[exact]", lambda: db.count_search_results(sample.author, exact=True)),
+        ("count_search_results[partial]", lambda: db.count_search_results(word, limit=1000)),
+        ("get_facet_counts", db.get_facet_counts),
+        ("get_facet_counts[partial]", lambda: db.get_facet_counts(word)),
+        ("get_facet_counts[filtered]", lambda: db.get_facet_counts(filters=narrow)),
+        ("get_facet_counts[has_translator]", lambda: db.get_facet_counts(filters={"has_translator": True})),
+        ("get_facet_counts[partial filtered]", lambda: db.get_facet_counts(word, filters=narrow)),
+        ("get_facet_counts[partial has_translator]",
+         lambda: db.get_facet_counts(word, filters={"has_translator": True})),
+        ("search_books_page[filtered]", lambda: db.search_books_page(word, filters=narrow)),
+        ("search_books_page[has_translator]", lambda: db.search_books_page(word, filters={"has_translator": True})),
+        ("search_books_page_cursor[filtered]", lambda: db.search_books_page_cursor(word, page=2, filters=narrow)),
+        ("count_search_results[filtered]", lambda: db.count_search_results(word, filters=narrow)),
+        ("iter_books_for_export", lambda: next(db.iter_books_for_export())),
+        ("get_export_rows_after", lambda: db.get_export_rows_after(sample.id)),
+        ("update_inventory", lambda: db.update_inventory(sample.id, available=1)),
+        ("adjust_inventory", lambda: db.adjust_inventory(sample.id, available=1)),
+        ("adjust_inventory_batch", lambda: db.adjust_inventory_batch([(sample.id, {"damaged": 1})])),
+        ("update_book", lambda: db.update_book(sample.id, data)),
+        ("insert_book+delete_book", insert_delete_book),
+        ("insert_books_batch", batch_insert_delete),
+        ("get_users_after", lambda: db.get_users_after(user.id)),
+        ("get_users_before", lambda: db.get_users_before(user.id + 100)),
+        ("get_users_paginated", lambda: db.get_users_paginated(5, 100)),
+        ("get_users_page_cursor", lambda: db.get_users_page_cursor(5)),
+        ("get_total_users_count", db.get_total_users_count),
+        ("get_users_after[sorted]", lambda: (db.get_users_after((user.name, user.id), sort="name"),
+                                             db.get_users_after((user.email, user.id), sort="-email"))),
+        ("get_users_before[sorted]", lambda: db.get_users_before((user.email, user.id), sort="email")),
+        ("get_users_page_cursor[sorted]", lambda: db.get_users_page_cursor(5, sort="-name")),
+        ("search_users[exact]", lambda: db.search_users(user.email.upper(), exact=True)),
+        ("search_users[partial]", lambda: db.search_users(user.name[:4])),
+        ("search_users_page[exact]", lambda: db.search_users_page(user.name, exact=True)),
+        ("search_users_page[partial]", lambda: db.search_users_page(user.name[:4])),
+        ("search_users_page_cursor", lambda: db.search_users_page_cursor(user.name[:4], page=2)),
+        ("count_search_users[exact]", lambda: db.count_search_users(user.phone, exact=True)),
+        ("count_search_users[partial]", lambda: db.count_search_users(user.name[:4])),
+        ("insert_user+update_user+delete_user", insert_delete_user),
+        ("checkout+checkin", lambda: db.checkin(db.checkout(lendable, active_user))),
+        ("get_overdue_loans", lambda: db.get_overdue_loans(after=("2000-01-01", 0))),
+        ("get_user_loans", lambda: db.get_user_loans(user.id)),
+        ("get_book_loans", lambda: db.get_book_loans(sample.id, open_only=True)),
+    ]
+
+
+def check(books=20_000, users=5_000, verbose=False):
+    """Run every case and return a list of (case, sql, scan lines) failures."""
+    workdir = tempfile.mkdtemp(prefix="query_plan_")
+    # The timing wrappers install their own trace callback
+    instrumentation.configure(enabled=False)
+    benchmark.build_database(os.path.join(workdir, "library.db"), books, users)
+    conn = connection.get_connection()
+    tables = _tables(conn)
+    failures = []
+    try:
+        for case, fn in _cases(books):
+            statements = []
+            conn.set_trace_callback(statements.append)
+            try:
+                fn()
+            finally:
+                conn.set_trace_callback(None)
+            for sql in statements:
+                if not _EXPLAINABLE.match(sql):
+                    continue
+                scans = full_scans(conn, sql, tables)
+                if verbose:
+                    print(f"{case}: {' '.join(sql.split())[:100]}\n    {scans or 'ok'}")
+                if scans and case not in ALLOWED_SCANS:
+                    failures.append((case, sql, scans))
+    finally:
+        connection.close_all_connections()
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--verbose", action="store_true", help="print every statement and its scans")
+    args = parser.parse_args(argv)
+
+    failures = check(args.books, args.users, args.verbose)
+    for case, sql, scans in failures:
+        print(f"FULL SCAN in {case}:\n  {' '.join(sql.split())}\n  -> {'; '.join(scans)}", file=sys.stderr)
+    if not failures:
+        print("✅ No unexpected full scans.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
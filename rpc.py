@@ -0,0 +1,162 @@
+"""Wire format shared by server.py and its clients.
+
+One JSON document per line over a plain TCP connection:
+
+    {"id": 1, "method": "get_books_after", "args": [0], "kwargs": {"page_size": 100}}
+    {"id": 1, "result": [...]}          or    {"id": 1, "error": {"type": "ValueError", "message": "..."}}
+
+A JSON array of requests is a batch: the server runs the calls one after
+another and answers with an array in the same order.
+Book/User/Inventory values travel as {"$model": name, "values": [...]}.
+"""
+import itertools
+import json
+import socket
+import sqlite3
+import threading
+from datetime import date
+
+from models import Book, BookColumns, Inventory, User
+
+DEFAULT_PORT = 8765
+
+# db.py functions reachable over the wire, grouped like db.py
+METHODS = (
+    # books
+    "insert_book", "insert_books_batch", "get_book", "find_book_by_title", "find_books_by_isbn", "get_books_after",
+    "get_books_before", "get_books_page_cursor", "get_total_books_count", "update_book", "delete_book",
+    "search_books_page", "search_books_page_cursor", "count_search_results", "get_facet_counts",
+    "find_duplicate_isbns", "get_export_rows_after",
+    # inventory
+    "get_inventory", "get_copy_summary", "update_inventory", "adjust_inventory", "adjust_inventory_batch",
+    # users
+    "insert_user", "update_user", "delete_user", "get_users_after", "get_users_before", "get_users_page_cursor",
+    "get_total_users_count", "search_users_page", "search_users_page_cursor", "count_search_users",
+    # loans
+    "checkout", "checkin", "get_overdue_loans", "get_user_loans", "get_book_loans",
+    # maintenance
+    "has_pending_indexes", "cache_stats",
+)
+
+# The subset of METHODS that writes; these go through the write queue
+WRITE_METHODS = {
+    "insert_book", "insert_books_batch", "update_book", "delete_book", "update_inventory", "adjust_inventory",
+    "adjust_inventory_batch", "insert_user", "update_user", "delete_user", "checkout", "checkin",
+}
+
+# Same limit for every paginated call, whether it comes from the UI or not
+MAX_PAGE_SIZE = 1000
+
+# Parameters sent as ISO strings that db.py expects as dates
+DATE_PARAMS = {"loan_date", "return_date", "as_of"}
+
+_MODELS = {cls.__name__: cls for cls in (Book, User, Inventory)}
+
+# Exceptions re-raised as themselves on the client; anything else is a RemoteError
+_ERRORS = {cls.__name__: cls for cls in (ValueError, KeyError, TypeError, sqlite3.IntegrityError,
+                                         sqlite3.OperationalError)}
+
+
+class RemoteError(RuntimeError):
+    pass
+
+
+def _default(value):
+    if isinstance(value, (Book, User, Inventory)):
+        return {"$model": type(value).__name__, "values": [getattr(value, name) for name in value.__slots__]}
+    if isinstance(value, BookColumns):
+        return list(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Can't send {type(value).__name__} over the wire")
+
+
+def _object_hook(obj):
+    model = obj.get("$model")
+    return _MODELS[model](*obj["values"]) if model else obj
+
+
+def dumps(value):
+    return json.dumps(value, default=_default, separators=(",", ":")).encode() + b"\n"
+
+
+def loads(line):
+    return json.loads(line, object_hook=_object_hook)
+
+
+def error_payload(ex):
+    return {"type": type(ex).__name__, "message": str(ex)}
+
+
+def _raise(error):
+    raise _ERRORS.get(error["type"], RemoteError)(error["message"])
+
+
+class RemoteBackend:
+    """Calls db.py functions on a server.py instance.
+
+    Each thread gets its own socket, so the DbExecutor workers can have
+    calls in flight at the same time. Functions are attributes:
+    `remote.get_books_after(0, page_size=100)`.
+    """
+
+    def __init__(self, address, timeout=30):
+        host, _, port = address.rpartition(":")
+        self.address = (host or "127.0.0.1", int(port or DEFAULT_PORT))
+        self.timeout = timeout
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+
+    def _stream(self):
+        stream = getattr(self._local, "stream", None)
+        if stream is None:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._local.sock = sock
+            stream = self._local.stream = sock.makefile("rwb")
+        return stream
+
+    def _roundtrip(self, payload):
+        stream = self._stream()
+        try:
+            stream.write(dumps(payload))
+            stream.flush()
+            line = stream.readline()
+        except OSError:
+            self.close()
+            raise
+        if not line:
+            self.close()
+            raise RemoteError("Server closed the connection")
+        return loads(line)
+
+    def call(self, method, *args, **kwargs):
+        response = self._roundtrip({"id": next(self._ids), "method": method, "args": args, "kwargs": kwargs})
+        if "error" in response:
+            _raise(response["error"])
+        return response["result"]
+
+    def batch(self, calls):
+        """Run [(method, args, kwargs), ...] in one round trip; returns their results in order.
+
+        Every call runs even if an earlier one fails; the first failure is
+        then raised.
+        """
+        responses = self._roundtrip([{"id": next(self._ids), "method": method, "args": args, "kwargs": kwargs}
+                                     for method, args, kwargs in calls])
+        for response in responses:
+            if "error" in response:
+                _raise(response["error"])
+        return [response["result"] for response in responses]
+
+    def close(self):
+        stream = getattr(self._local, "stream", None)
+        if stream is not None:
+            self._local.stream = None
+            stream.close()
+            self._local.sock.close()
+
+    def __getattr__(self, method):
+        if method not in METHODS:
+            raise AttributeError(method)
+        return lambda *args, **kwargs: self.call(method, *args, **kwargs)
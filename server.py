@@ -0,0 +1,135 @@
+"""Serve the db.py data layer to several Book Manager windows at once.
+
+    python server.py --db library.db --port 8765
+    BOOKMANAGER_SERVER=127.0.0.1:8765 python main.py
+
+Speaks the line-delimited JSON protocol described in rpc.py. Requests are
+read by asyncio; reads run on a fixed pool of worker threads, each holding
+one long-lived connection, so the pool size is the number of reader
+connections. Writes from every client go through the shared write queue,
+which group-commits them on its own connection. Calls on one client
+connection are answered in order.
+"""
+import argparse
+import asyncio
+import functools
+import inspect
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import connection
+import db
+from rpc import DATE_PARAMS, DEFAULT_PORT, MAX_PAGE_SIZE, METHODS, WRITE_METHODS, dumps, error_payload, loads
+from write_queue import write_queue
+
+# Request lines can carry a whole import batch
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+
+def _check_params(fn, args, kwargs):
+    """Bind a call's arguments to fn's parameters and check them.
+
+    Binding means a page_size passed positionally is capped like one
+    passed by keyword. Raises TypeError for arguments fn doesn't take.
+    """
+    bound = inspect.signature(fn).bind(*args, **kwargs)
+    params = bound.arguments
+    for name in DATE_PARAMS & params.keys():
+        if params[name] is not None:
+            params[name] = date.fromisoformat(params[name])
+    page_size = params.get("page_size")
+    if page_size is not None and not 0 < page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f"page_size must be between 1 and {MAX_PAGE_SIZE}")
+    return bound
+
+
+def _prepare(request):
+    """The db.py call a request dict asks for, as a no-argument callable."""
+    method = request.get("method")
+    if method not in METHODS:
+        raise ValueError(f"Unknown method: {method}")
+    fn = getattr(db, method)
+    bound = _check_params(fn, request.get("args", ()), dict(request.get("kwargs") or {}))
+    return functools.partial(fn, *bound.args, **bound.kwargs)
+
+
+class Server:
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, workers=8):
+        self.host = host
+        self.port = port
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self._server = None
+
+    async def dispatch(self, request):
+        """Run one request dict against db.py and build its response."""
+        if not isinstance(request, dict):
+            return {"id": None, "error": error_payload(ValueError("A request must be a JSON object"))}
+        try:
+            call = _prepare(request)
+            if request["method"] in WRITE_METHODS:
+                result = await asyncio.wrap_future(write_queue.submit(call))
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(self.pool, call)
+        except Exception as ex:
+            return {"id": request.get("id"), "error": error_payload(ex)}
+        return {"id": request.get("id"), "result": result}
+
+    async def _handle(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    request = loads(line)
+                except ValueError as ex:
+                    response = {"id": None, "error": error_payload(ex)}
+                else:
+                    if isinstance(request, list):
+                        response = [await self.dispatch(r) for r in request]
+                    else:
+                        response = await self.dispatch(request)
+                writer.write(dumps(response))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, limit=MAX_REQUEST_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"📡 Serving {connection.get_db_name()} on {self.host}:{self.port}", flush=True)
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        self.pool.shutdown(wait=True)
+        write_queue.shutdown()
+        connection.close_all_connections()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=connection.DB_NAME)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="0 picks a free port")
+    parser.add_argument("--workers", type=int, default=8, help="worker threads, i.e. pooled connections")
+    args = parser.parse_args(argv)
+
+    connection.configure(db_name=args.db)
+    db.create_tables()
+    server = Server(args.host, args.port, args.workers)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
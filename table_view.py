@@ -0,0 +1,60 @@
+import flet as ft
+
+
+class PooledTable:
+    """Renders pages into an ft.DataTable by reusing a pool of row controls.
+
+    Every row slot (cells, texts and action buttons) is built once. Showing
+    a new page only rewrites the text/colour values that differ from what
+    the slot already displays and hides slots the page doesn't need, so
+    Flet sends a small patch instead of a whole new control tree.
+    """
+
+    def __init__(self, table, format_row, actions, row_colors=("grey100", "white")):
+        """
+        format_row(record) -> list of (text, color) pairs, one per data
+        column (color None for the default). actions is a list of
+        (icon, tooltip, icon_color, handler) and handler(record) is called
+        with the record currently shown in the clicked row.
+        """
+        self.table = table
+        self.format_row = format_row
+        self.actions = actions
+        self.row_colors = row_colors
+        self._texts = []
+
+    def _add_slot(self):
+        index = len(self.table.rows)
+        row = ft.DataRow(cells=[], color=self.row_colors[index % len(self.row_colors)])
+        texts = []
+        for _ in range(len(self.table.columns) - 1):
+            text = ft.Text()
+            texts.append(text)
+            row.cells.append(ft.DataCell(text))
+        buttons = [
+            ft.IconButton(icon=icon, tooltip=tooltip, icon_color=color,
+                          on_click=lambda e, r=row, h=handler: h(r.data))
+            for icon, tooltip, color, handler in self.actions
+        ]
+        row.cells.append(ft.DataCell(ft.Row(buttons, spacing=5, wrap=False)))
+        self.table.rows.append(row)
+        self._texts.append(texts)
+
+    def show(self, records):
+        """Display `records`, touching only the controls whose values changed."""
+        while len(self.table.rows) < len(records):
+            self._add_slot()
+
+        for row, texts, record in zip(self.table.rows, self._texts, records):
+            row.data = record
+            row.visible = True
+            for text, (value, color) in zip(texts, self.format_row(record)):
+                if text.value != value:
+                    text.value = value
+                if text.color != color:
+                    text.color = color
+
+        for row in self.table.rows[len(records):]:
+            if row.visible:
+                row.visible = False
+                row.data = None
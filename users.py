@@ -1,13 +1,26 @@
 import flet as ft
-from db import create_user_tables, get_users_paginated, get_total_users_count, insert_user, update_user, delete_user, search_users
+from backend import get_users_after, get_users_before, get_users_page_cursor, get_total_users_count, \
+    insert_user, update_user, delete_user, search_users_page, search_users_page_cursor, count_search_users
+from connection import is_busy_error
+from executor import db_executor
+from table_view import PooledTable
 
 def create_users_tab(page, show_snack_bar):
     selected_user_id = None
     current_page = 1
     page_size = 100
-    total_users = get_total_users_count()
+    # How to reach the visible page: ("page", n) jumps through the sparse
+    # page index, ("after", key)/("before", key) seek from a neighbouring
+    # row. Keys are user ids, or (value, id) pairs while sorted by a column.
+    page_request = ("page", 1)
+    page_loaded = False
+    first_key = None
+    last_key = None
+    total_users = 0  # set by the first page load, which runs in the background
     show_form = False
-    filtered_users = None
+    search_term = None
+    search_exact = False
+    sort = None  # "name", "-email", ...; search results keep their own order
 
     # Form fields for user data input
     fields = {
@@ -45,12 +58,11 @@ def create_users_tab(page, show_snack_bar):
 
     def fill_form(user):
         nonlocal selected_user_id, show_form
-        selected_user_id = user[0]
+        selected_user_id = user.id
         show_form = True
         form_section.visible = True
-        for key, value in zip(fields.keys(), user[1:]):
-            if key in fields:
-                fields[key].value = str(value or "")
+        for key, field in fields.items():
+            field.value = str((user.id if key == "user_id" else getattr(user, key)) or "")
         page.update()
 
     def parse_user_form():
@@ -87,25 +99,32 @@ def create_users_tab(page, show_snack_bar):
             show_snack_bar("Please fill all required fields.")
             return
 
-        try:
-            if selected_user_id:
-                update_user(selected_user_id, data)
-            else:
-                insert_user(data)
-
+        def on_saved(_):
             clear_fields()
             refresh_users()
 
-        except Exception as ex:
+        if selected_user_id:
+            db_executor.submit(update_user, selected_user_id, data, on_done=on_saved, on_error=show_error)
+        else:
+            db_executor.submit(insert_user, data, on_done=on_saved, on_error=show_error)
+
+    def show_error(ex):
+        loading_bar.visible = False
+        if is_busy_error(ex):
+            show_snack_bar("⚠️ The database is busy with another program's changes. Please try again.")
+        else:
             show_snack_bar(f"Error: {ex}")
+        page.update()
 
     def delete_user_action(user_id):
-        def confirm_delete(e):
-            delete_user(user_id)
+        def on_deleted(_):
             refresh_users()
+            show_snack_bar("User deleted successfully!", ft.Colors.GREEN_100)
+
+        def confirm_delete(e):
             page.dialog.open = False
             page.update()
-            show_snack_bar("User deleted successfully!", ft.Colors.GREEN_100)
+            db_executor.submit(delete_user, user_id, on_done=on_deleted, on_error=show_error)
 
         def cancel_delete(e):
             page.dialog.open = False
@@ -125,97 +144,133 @@ def create_users_tab(page, show_snack_bar):
         page.dialog.open = True
         page.update()
 
-    def update_table():
-        user_table.rows.clear()
+    def update_table(recount=False):
+        nonlocal page_loaded
+        # Snapshot the request: the worker must fetch exactly what was asked
+        # for even if the user clicks on before it runs.
+        term, exact, size, order = search_term, search_exact, page_size, sort
+        kind, value = page_request
+
+        def fetch():
+            nonlocal kind, value
+            if kind == "page":
+                if term is not None:
+                    kind, value = "after", search_users_page_cursor(term, exact, value, size)
+                else:
+                    kind, value = "after", get_users_page_cursor(value, size, sort=order)
+            if term is not None:
+                rows = search_users_page(term, exact, value, size, before=kind == "before")
+                total = count_search_users(term, exact) if recount else None
+            else:
+                if kind == "before":
+                    rows = get_users_before(value, size, sort=order)
+                else:
+                    rows = get_users_after(value, size, sort=order)
+                total = get_total_users_count()
+            if not rows:
+                keys = (None, None)
+            elif order and term is None:
+                column = order.lstrip("-")
+                keys = ((getattr(rows[0], column), rows[0].id), (getattr(rows[-1], column), rows[-1].id))
+            else:
+                keys = (rows[0].id, rows[-1].id)
+            return rows, total, keys
+
+        page_loaded = False
+        loading_bar.visible = True
+        page.update()
+        db_executor.submit(fetch, key="users.page", on_done=render_table, on_error=show_error)
+
+    def render_table(result):
+        nonlocal page_loaded, total_users, first_key, last_key
+        users, total, (first_key, last_key) = result
+        if total is not None:
+            total_users = total
 
-        if filtered_users is not None:
-            total_users = len(filtered_users)
-            users = filtered_users[(current_page - 1) * page_size: current_page * page_size]
-        else:
-            total_users = get_total_users_count()
-            users = get_users_paginated(current_page, page_size)
+        user_table.sort_column_index = sort_columns.index(sort.lstrip("-")) if sort and search_term is None else None
+        user_table.sort_ascending = not (sort or "").startswith("-")
 
         total_pages = max(1, (total_users + page_size - 1) // page_size)
-
-        for index, user in enumerate(users):
-            user_id = user[0]
-            status = user[5]
-            status_Colors = {
-                "Active": ft.Colors.GREEN_400,
-                "Inactive": ft.Colors.AMBER_600,
-                "Suspended": ft.Colors.RED_500,
-            }
-            colored_status = ft.Text(status, color=status_Colors.get(status, ft.Colors.GREY_600))
-
-            data_cells = [ft.DataCell(ft.Text(str(cell))) for cell in user[0:5]]
-            data_cells.append(ft.DataCell(colored_status))
-            data_cells.append(ft.DataCell(ft.Row([
-                ft.IconButton(
-                    icon=ft.Icons.EDIT,
-                    tooltip="Edit",
-                    on_click=lambda e, u=user: fill_form(u),
-                    icon_color=ft.Colors.ORANGE_400
-                ),
-                ft.IconButton(
-                    icon=ft.Icons.DELETE,
-                    tooltip="Delete",
-                    on_click=lambda e, uid=user_id: delete_user_action(uid),
-                    icon_color=ft.Colors.RED_400
-                )
-            ], spacing=5, wrap=False)))
-
-            row_color = ft.Colors.GREY_100 if index % 2 == 0 else ft.Colors.WHITE
-            user_table.rows.append(ft.DataRow(cells=data_cells, color=row_color))
+        user_rows.show(users)
 
         page_label.value = f"Page {current_page} of {total_pages} | Total: {total_users}"
+        page_loaded = True
+        loading_bar.visible = False
         page.update()
 
-    def refresh_users(filtered=None):
-        nonlocal filtered_users, current_page
-        current_page = 1
-        filtered_users = filtered
-        update_table()
+    def format_user_row(user):
+        status = user.status
+        cells = [(str(getattr(user, name)), None) for name in ["id", "name", "email", "phone", "membership_type"]]
+        cells.append((status, status_colors.get(status, ft.Colors.GREY_600)))
+        return cells
+
+    def handle_sort(e):
+        nonlocal sort
+        if search_term is not None:
+            show_snack_bar("Search results are listed by relevance. Clear the search to sort.")
+            return
+        column = sort_columns[e.column_index]
+        sort = column if e.ascending else f"-{column}"
+        refresh_users()
+
+    def set_page(number):
+        nonlocal current_page, page_request
+        current_page = number
+        page_request = ("page", number)
+
+    def refresh_users(term=None, exact=False):
+        nonlocal search_term, search_exact
+        search_term, search_exact = term, exact
+        set_page(1)
+        update_table(recount=True)
 
     def handle_search(e):
         term = search_input.value.strip()
         is_exact = exact_search_toggle.value
 
         if term:
-            results = search_users(term, exact=is_exact)
-            refresh_users(results)
+            refresh_users(term, is_exact)
         else:
-            refresh_users(None)
+            refresh_users()
 
     def go_to_page(e):
-        nonlocal current_page
         try:
             req = int(page_input.value.strip())
             max_pages = max(1, (total_users + page_size - 1) // page_size)
             if 1 <= req <= max_pages:
-                current_page = req
+                set_page(req)
                 update_table()
         except:
             pass
 
     def change_page_size(e):
-        nonlocal page_size, current_page
+        nonlocal page_size
         try:
             page_size = int(page_size_dropdown.value)
-            current_page = 1
+            set_page(1)
             update_table()
         except:
             pass
 
     def prev_page(e):
-        nonlocal current_page
+        nonlocal current_page, page_request
         if current_page > 1:
-            current_page -= 1
+            if page_loaded and first_key is not None and current_page > 2:
+                current_page -= 1
+                page_request = ("before", first_key)
+            else:
+                set_page(current_page - 1)
             update_table()
 
     def next_page(e):
-        nonlocal current_page
+        nonlocal current_page, page_request
         if current_page < max(1, (total_users + page_size - 1) // page_size):
-            current_page += 1
+            if page_loaded:
+                current_page += 1
+                page_request = ("after", last_key)
+            else:
+                # The visible page hasn't arrived yet, so its keys are stale
+                set_page(current_page + 1)
             update_table()
 
     def toggle_form(e):
@@ -238,15 +293,29 @@ def create_users_tab(page, show_snack_bar):
         on_change=change_page_size
     )
 
+    # Column each header sorts by (None: not sortable)
+    sort_columns = [None, "name", "email", None, None, None, None]
     user_table = ft.DataTable(
-        columns=[ft.DataColumn(label=ft.Text(h)) for h in
-                 ["ID", "Name", "Email", "Phone", "Membership Type", "Status", "Actions"]],
+        columns=[ft.DataColumn(label=ft.Text(h), on_sort=handle_sort if column else None)
+                 for h, column in zip(["ID", "Name", "Email", "Phone", "Membership Type", "Status", "Actions"],
+                                      sort_columns)],
         rows=[],
         expand=True
     )
 
+    status_colors = {
+        "Active": ft.Colors.GREEN_400,
+        "Inactive": ft.Colors.AMBER_600,
+        "Suspended": ft.Colors.RED_500,
+    }
+    user_rows = PooledTable(user_table, format_user_row, actions=[
+        (ft.Icons.EDIT, "Edit", ft.Colors.ORANGE_400, fill_form),
+        (ft.Icons.DELETE, "Delete", ft.Colors.RED_400, lambda user: delete_user_action(user.id)),
+    ], row_colors=(ft.Colors.GREY_100, ft.Colors.WHITE))
+
+    loading_bar = ft.ProgressBar(visible=False)
     table_container = ft.Container(
-        content=ft.Column([user_table], scroll=ft.ScrollMode.ALWAYS, expand=True),
+        content=ft.Column([loading_bar, user_table], scroll=ft.ScrollMode.ALWAYS, expand=True),
         bgcolor=ft.Colors.GREY_100,
         expand=True
     )
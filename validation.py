@@ -0,0 +1,55 @@
+import re
+
+BOOK_FIELDS = ["book_number", "title", "author", "translator", "pub_date", "isbn", "language", "genre", "edition",
+               "status"]
+
+
+def _isbn13_check_digit(first12):
+    return str((10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(first12)) % 10) % 10)
+
+
+def normalize_isbn(value):
+    """The ISBN-13 form of an ISBN-10 or ISBN-13, or None if it isn't a valid one.
+
+    Hyphens and spaces are ignored, so '0-306-40615-2', '978-0-306-40615-7'
+    and '9780306406157' all give '9780306406157'.
+    """
+    digits = re.sub(r"[\s-]", "", str(value or "")).upper()
+    if re.fullmatch(r"\d{9}[\dX]", digits):
+        if sum((10 - i) * (10 if d == "X" else int(d)) for i, d in enumerate(digits)) % 11:
+            return None
+        digits = "978" + digits[:9]
+        return digits + _isbn13_check_digit(digits)
+    if re.fullmatch(r"\d{13}", digits) and _isbn13_check_digit(digits[:12]) == digits[12]:
+        return digits
+    return None
+
+
+def parse_book(values):
+    """Normalise raw book values (form fields or an imported row).
+
+    Returns (data, errors): data has one entry per BOOK_FIELDS key in
+    insert_book order, errors lists the keys that failed validation.
+    """
+    data = {}
+    errors = []
+    for k in BOOK_FIELDS:
+        val = values.get(k)
+        if k == "book_number":
+            if isinstance(val, float) and val.is_integer():
+                val = int(val)
+            text = str(val).strip() if val is not None else ""
+            data[k] = int(text) if text.isdigit() else None
+        else:
+            data[k] = str(val).strip() if val is not None else ""
+
+    if not data["title"]:
+        errors.append("title")
+    if not data["author"]:
+        errors.append("author")
+    if data["book_number"] is None:
+        errors.append("book_number")
+    if data["isbn"] and normalize_isbn(data["isbn"]) is None:
+        errors.append("isbn")
+
+    return data, errors
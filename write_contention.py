@@ -0,0 +1,148 @@
+"""Measure write throughput when several writers share library.db.
+
+    python write_contention.py --threads 8 --processes 2 --seconds 5
+
+Builds a temporary catalog (benchmark.build_database) and, for each mode,
+runs --threads writer threads in this process plus --processes other
+processes writing directly (like a second app window or seed_data.py),
+while one reader thread keeps paging through books:
+
+    direct  every thread writes on its own connection (busy_timeout + retry)
+    queued  threads hand their writes to the write queue (group commit)
+
+Prints writes/sec, write and read latency percentiles and error counts
+per mode as JSON. Group commit pays off when commits are expensive; try
+--synchronous FULL to see the difference.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import benchmark
+import connection
+import db
+from write_queue import WriteQueue
+
+
+def _percentile(sorted_ms, p):
+    return sorted_ms[min(len(sorted_ms) - 1, int(len(sorted_ms) * p / 100))] if sorted_ms else 0.0
+
+
+def _write_once(books):
+    book_id = random.randrange(1, books + 1)
+    db.adjust_inventory(book_id, damaged=1)
+
+
+def _writer(write, books, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            write(books)
+        except Exception as ex:
+            errors.append(str(ex))
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+def _reader(books, deadline, latencies):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        db.get_books_after(random.randrange(books), page_size=100)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+def _pragmas(synchronous):
+    return dict(connection.PRAGMA_PROFILE, synchronous=synchronous)
+
+
+def _external_writer(db_path, books, seconds, synchronous):
+    """Entry point of the --processes children; prints how many writes succeeded."""
+    connection.configure(db_name=db_path, pragmas=_pragmas(synchronous))
+    latencies, errors = [], []
+    _writer(_write_once, books, time.perf_counter() + seconds, latencies, errors)
+    print(json.dumps({"writes": len(latencies), "errors": len(errors)}), flush=True)
+
+
+def run_mode(mode, db_path, books, threads, processes, seconds, synchronous):
+    connection.configure(db_name=db_path, pragmas=_pragmas(synchronous))
+    queue = WriteQueue() if mode == "queued" else None
+    write = (lambda n: queue.call(_write_once, n)) if queue else _write_once
+    children = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", db_path, str(books),
+                                  str(seconds), synchronous], stdout=subprocess.PIPE, text=True)
+                for _ in range(processes)]
+    deadline = time.perf_counter() + seconds
+    write_ms, read_ms, errors = [], [], []
+    workers = [threading.Thread(target=_writer, args=(write, books, deadline, write_ms, errors))
+               for _ in range(threads)]
+    workers.append(threading.Thread(target=_reader, args=(books, deadline, read_ms)))
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    external = [json.loads(child.communicate()[0]) for child in children]
+    if queue:
+        queue.shutdown()
+    connection.close_all_connections()
+
+    write_ms.sort()
+    read_ms.sort()
+    report = {
+        "writes": len(write_ms),
+        "writes_per_sec": len(write_ms) / seconds,
+        "errors": len(errors),
+        "write_p50_ms": _percentile(write_ms, 50),
+        "write_p95_ms": _percentile(write_ms, 95),
+        "read_p50_ms": _percentile(read_ms, 50),
+        "read_p95_ms": _percentile(read_ms, 95),
+        "external_writes": sum(e["writes"] for e in external),
+        "external_errors": sum(e["errors"] for e in external),
+    }
+    if queue:
+        report["writes_per_group"] = queue.stats()["writes_per_group"]
+    if errors:
+        report["first_errors"] = errors[:3]
+    return report
+
+
+def run(threads=8, processes=1, seconds=5, books=20_000, users=2_000, modes=("direct", "queued"),
+        synchronous="NORMAL"):
+    workdir = tempfile.mkdtemp(prefix="write_contention_")
+    db_path = os.path.join(workdir, "library.db")
+    benchmark.build_database(db_path, books, users)
+    return {
+        "threads": threads,
+        "processes": processes,
+        "seconds": seconds,
+        "synchronous": synchronous,
+        "modes": {mode: run_mode(mode, db_path, books, threads, processes, seconds, synchronous) for mode in modes},
+    }
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["--child"]:
+        _external_writer(argv[1], int(argv[2]), float(argv[3]), argv[4])
+        return 0
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=1, help="extra processes writing directly")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--books", type=int, default=20_000)
+    parser.add_argument("--modes", nargs="+", default=["direct", "queued"], choices=["direct", "queued"])
+    parser.add_argument("--synchronous", default="NORMAL", choices=["OFF", "NORMAL", "FULL"])
+    args = parser.parse_args(argv)
+
+    report = run(args.threads, args.processes, args.seconds, args.books, modes=args.modes,
+                 synchronous=args.synchronous)
+    print(json.dumps(report, indent=2))
+    return 1 if any(m["errors"] or m["external_errors"] for m in report["modes"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
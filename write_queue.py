@@ -0,0 +1,122 @@
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from connection import BUSY_BACKOFF, BUSY_RETRIES, get_connection, is_busy_error
+
+
+class WriteQueue:
+    """Funnels db.py writes from many threads through one writer thread.
+
+    Whatever is queued when the writer wakes up (up to `max_group` calls)
+    runs inside a single BEGIN IMMEDIATE ... COMMIT, so N concurrent
+    writers cost one lock acquisition and one WAL sync instead of N. Each
+    call gets its own savepoint: one that raises is rolled back alone and
+    its caller gets the exception, the rest of the group still commits.
+    Readers use their own WAL connections and never wait for the writer.
+    """
+
+    def __init__(self, max_group=64):
+        self.max_group = max_group
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.groups = 0
+        self.writes = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs); returns a Future for its result."""
+        future = Future()
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                    self._thread.start()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn through the queue and wait for its result (or exception)."""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def wrap(self, fn):
+        """fn, but every call goes through the queue."""
+        def queued(*args, **kwargs):
+            return self.call(fn, *args, **kwargs)
+        queued.__name__ = fn.__name__
+        queued.__doc__ = fn.__doc__
+        return queued
+
+    def _run(self):
+        while True:
+            group = [self._queue.get()]
+            if group[0] is None:
+                return
+            while len(group) < self.max_group:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    self._queue.put(None)
+                    break
+                group.append(job)
+            self._commit_group(group)
+
+    def _begin(self, conn):
+        for attempt in range(BUSY_RETRIES):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as ex:
+                if not is_busy_error(ex) or attempt == BUSY_RETRIES - 1:
+                    raise
+            time.sleep(random.uniform(0, BUSY_BACKOFF * 2 ** attempt))
+
+    def _commit_group(self, group):
+        outcomes = []
+        conn = get_connection()
+        try:
+            self._begin(conn)
+            conn.group_commit = True
+            try:
+                for fn, args, kwargs, _ in group:
+                    conn.execute("SAVEPOINT queued_write")
+                    try:
+                        outcomes.append((True, fn(*args, **kwargs)))
+                    except BaseException as ex:
+                        conn.execute("ROLLBACK TO queued_write")
+                        outcomes.append((False, ex))
+                    conn.execute("RELEASE queued_write")
+            finally:
+                conn.group_commit = False
+            conn.commit()
+        except BaseException as ex:
+            if conn.in_transaction:
+                conn.rollback()
+            # Nothing in the group was committed
+            outcomes = [(False, ex)] * len(group)
+        self.groups += 1
+        self.writes += len(group)
+        for (ok, value), (_, _, _, future) in zip(outcomes, group):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def stats(self):
+        return {"groups": self.groups, "writes": self.writes,
+                "writes_per_group": self.writes / self.groups if self.groups else 0.0}
+
+    def shutdown(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+# Shared by the app and server.py
+write_queue = WriteQueue()